@@ -12,6 +12,8 @@ import os
 import sys
 import traceback
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 import click
 from click import secho as _echo
@@ -25,7 +27,7 @@ except ImportError:  # pragma: no cover
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
                                 'packages'))
 try:
-    from pip._internal.network.session import PipSession
+    from pip._internal.exceptions import InstallationError
 except (TypeError, ImportError):  # pragma: no cover
     # on Windows, non-ASCII characters in import path can be fixed using
     # the script path from sys.argv[0].
@@ -33,22 +35,27 @@ except (TypeError, ImportError):  # pragma: no cover
     sys.path.insert(0,
                     os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])),
                                  'packages'))
-    from pip._internal.network.session import PipSession
+    from pip._internal.exceptions import InstallationError
 
-from pip._internal.exceptions import InstallationError
 from pip._internal.models.index import PyPI
-from pip._internal.req.constructors import install_req_from_parsed_requirement
 from pip._internal.req.req_file import (COMMENT_RE, SCHEME_RE,
                                         OptionParsingError, ParsedLine,
                                         RequirementsFileParser,
-                                        get_file_content, get_line_parser,
-                                        handle_line)
+                                        get_file_content, handle_line)
+from pip._vendor.requests.adapters import DEFAULT_POOLSIZE
 
 from .__about__ import __version__
+from .async_index import AsyncIndexClient
 from .exceptions import InvalidPackage, StopUpdating
-from .utils import (ExitCodeException, build_package_finder, can_check_version,
-                    current_version, format_list_arg, join_lines,
-                    latest_version, old_version, requirements_line,
+from .requirements import parse_requirement
+from .session import (DEFAULT_MAX_BACKOFF, DEFAULT_MAX_HOST_FAILURES,
+                      PurSession, default_cache_dir)
+from .utils import (ExitCodeException, build_line_parser,
+                    build_package_finder, can_check_version,
+                    forget_found_candidates, format_list_arg, index_options,
+                    is_excluded, join_lines, latest_version, old_version,
+                    requirement_name, requirements_line,
+                    restore_finder_options, save_finder_options,
                     should_update, update_requirement_line)
 
 
@@ -56,6 +63,11 @@ __all__ = ["update_requirements"]
 
 
 PUR_GLOBAL_UPDATED = 0
+ASYNC_DEFAULT_JOBS = 100
+# most connections opened ahead of time to each index host
+PRECONNECT_MAX = 10
+DEFAULT_RETRIES = 5
+DEFAULT_TIMEOUT = 15
 
 
 @click.command()
@@ -86,6 +98,10 @@ PUR_GLOBAL_UPDATED = 0
 @click.option('--index-url', type=click.STRING, multiple=True, help='Base ' +
               'URL of the Python Package Index. Can be provided multiple ' +
               'times for extra index urls.')
+@click.option('--json-index', is_flag=True, default=False,
+              help='Only request PEP 691 JSON pages from package indexes, ' +
+              'for indexes known to support them such as PyPI. Pages in ' +
+              'other formats are skipped.')
 @click.option('--cert', type=click.Path(), help='Path to PEM-encoded CA ' +
               'certificate bundle. If provided, overrides the default.')
 @click.option('--no-ssl-verify', is_flag=True, default=False,
@@ -109,6 +125,44 @@ PUR_GLOBAL_UPDATED = 0
               'version is considered for updating. Versions released more ' +
               'recently than this threshold are ignored, helping avoid ' +
               'recently published versions that may contain critical bugs.')
+@click.option('-j', '--jobs', type=click.INT,
+              help='Number of packages to look up on the package index ' +
+              'concurrently. Defaults to 1, looking up one package at a ' +
+              'time, or {0} when using --engine asyncio.'.format(ASYNC_DEFAULT_JOBS))
+@click.option('--engine', type=click.Choice(['threads', 'asyncio']),
+              default='threads', help='How to look up packages concurrently. ' +
+              'The asyncio engine fetches index pages for every package on ' +
+              'one event loop instead of one thread per request.')
+@click.option('--cache-dir', type=click.Path(file_okay=False),
+              help='Directory for caching package index pages between runs, ' +
+              'so unchanged pages are revalidated instead of downloaded ' +
+              'again. Defaults to the user cache directory.')
+@click.option('--no-cache', is_flag=True, default=False,
+              help='Disable caching package index pages.')
+@click.option('--index-ttl', type=click.INT, default=0, metavar='SECONDS',
+              help='Use cached package index pages younger than SECONDS ' +
+              'without checking the package index. Older cached pages are ' +
+              'still used, while being refreshed in the background for the ' +
+              'next run. By default cached pages are always revalidated.')
+@click.option('--retries', type=click.INT, default=DEFAULT_RETRIES,
+              help='Number of times to retry a failed request to a package ' +
+              'index, backing off between attempts and honoring ' +
+              'Retry-After headers up to --max-backoff. Defaults to ' +
+              '{0}.'.format(DEFAULT_RETRIES))
+@click.option('--timeout', type=click.FLOAT, default=DEFAULT_TIMEOUT,
+              metavar='SECONDS', help='Seconds to wait for a package index ' +
+              'to respond before giving up. Defaults to {0}.'.format(DEFAULT_TIMEOUT))
+@click.option('--max-backoff', type=click.FLOAT, default=DEFAULT_MAX_BACKOFF,
+              metavar='SECONDS', help='Most seconds to wait between ' +
+              'retries, including waits asked for by a Retry-After header. ' +
+              'Defaults to {0}.'.format(DEFAULT_MAX_BACKOFF))
+@click.option('--max-host-failures', type=click.INT,
+              default=DEFAULT_MAX_HOST_FAILURES, metavar='N',
+              help='Stop querying a package index host for the rest of the ' +
+              'run after N requests to it failed in a row, and keep using ' +
+              'the other indexes. Packages which may be stale because of ' +
+              'it are reported. Use 0 to never stop. Defaults to ' +
+              '{0}.'.format(DEFAULT_MAX_HOST_FAILURES))
 @click.option('-z', '--nonzero-exit-code', is_flag=True, default=False,
               help='Exit with status 1 when some packages were updated, 0 ' +
               'when no packages updated, or a number greater than 1 when ' +
@@ -130,6 +184,18 @@ def pur(**options):
 
     if options['cooldown_days'] < 0:
         raise ExitCodeException(2, message='--cooldown-days must be a non-negative integer.')
+    if options['jobs'] is not None and options['jobs'] < 1:
+        raise ExitCodeException(2, message='--jobs must be a positive integer.')
+    if options['index_ttl'] < 0:
+        raise ExitCodeException(2, message='--index-ttl must be a non-negative integer.')
+    if options['retries'] < 0:
+        raise ExitCodeException(2, message='--retries must be a non-negative integer.')
+    if options['timeout'] <= 0:
+        raise ExitCodeException(2, message='--timeout must be a positive number.')
+    if options['max_backoff'] < 0:
+        raise ExitCodeException(2, message='--max-backoff must be a non-negative number.')
+    if options['max_host_failures'] < 0:
+        raise ExitCodeException(2, message='--max-host-failures must be a non-negative integer.')
 
     options['echo'] = True
 
@@ -156,6 +222,16 @@ def pur(**options):
             cert=options['cert'],
             no_ssl_verify=options['no_ssl_verify'],
             cooldown_days=options['cooldown_days'],
+            jobs=options['jobs'],
+            engine=options['engine'],
+            cache_dir=options['cache_dir'],
+            no_cache=options['no_cache'],
+            index_ttl=options['index_ttl'],
+            retries=options['retries'],
+            timeout=options['timeout'],
+            max_backoff=options['max_backoff'],
+            max_host_failures=options['max_host_failures'],
+            json_index=options['json_index'],
         )
 
     except InstallationError as e:
@@ -177,7 +253,13 @@ def update_requirements(input_file=None, output_file=None, force=False,
                         dry_run=False, dry_run_changed=False,
                         minor=[], patch=[], pre=[], no_recursive=False,
                         echo=False, index_urls=[], cert=None,
-                        no_ssl_verify=False, cooldown_days=0):
+                        no_ssl_verify=False, cooldown_days=0, jobs=None,
+                        engine='threads', cache_dir=None, no_cache=False,
+                        index_ttl=0, retries=DEFAULT_RETRIES,
+                        timeout=DEFAULT_TIMEOUT,
+                        max_backoff=DEFAULT_MAX_BACKOFF,
+                        max_host_failures=DEFAULT_MAX_HOST_FAILURES,
+                        json_index=False):
     """Update a requirements file.
     Returns a dict of package update info.
     :param input_file:       Path to a requirements.txt file.
@@ -205,34 +287,93 @@ def update_requirements(input_file=None, output_file=None, force=False,
     :param cooldown_days:    Minimum number of days since release before a new
                              version is considered. Versions newer than this
                              are ignored.
+    :param jobs:             Number of packages to look up concurrently.
+                             Defaults to 1, or 100 with the asyncio engine.
+    :param engine:           Either threads or asyncio. The asyncio engine
+                             fetches index pages for all packages on a single
+                             event loop.
+    :param cache_dir:        Directory for caching package index pages.
+                             Defaults to the user cache directory.
+    :param no_cache:         Disable caching package index pages.
+    :param index_ttl:        Seconds to use cached package index pages without
+                             revalidating them. Older cached pages are used
+                             while being refreshed in the background.
+    :param retries:          Number of times to retry a failed request.
+    :param timeout:          Seconds to wait for a package index to respond.
+    :param max_backoff:      Most seconds to wait between retries, including
+                             waits asked for by a Retry-After header.
+    :param max_host_failures:  Stop querying an index host after this many
+                             requests to it failed in a row, or 0 to never
+                             stop.
+    :param json_index:       Only request PEP 691 JSON pages from package
+                             indexes.
     """
 
     obuffer = StringIO()
     updates = defaultdict(list)
+    # requirement lines repeat across nested files, so each is parsed once
+    requirement_cache = {}
 
-    _update_requirements(
-        obuffer, updates,
-        input_file=input_file,
-        output_buffer=obuffer if output_file else None,
-        output_file=output_file,
-        force=force,
-        interactive=interactive,
-        skip=skip,
-        skip_gt=skip_gt,
-        only=only,
-        minor=minor,
-        patch=patch,
-        pre=pre,
-        dry_run=dry_run,
-        dry_run_changed=dry_run_changed,
-        no_recursive=no_recursive,
-        echo=echo,
+    if jobs is None:
+        jobs = ASYNC_DEFAULT_JOBS if engine == 'asyncio' else 1
+
+    # one session and finder are shared by all nested requirements files, so
+    # connections and found candidates are reused
+    session, finder = _build_session_and_finder(
         index_urls=index_urls,
         cert=cert,
         no_ssl_verify=no_ssl_verify,
-        cooldown_days=cooldown_days,
+        interactive=interactive,
+        pre=pre,
+        cache_dir=None if no_cache else cache_dir or default_cache_dir(),
+        index_ttl=index_ttl,
+        pool_maxsize=jobs,
+        retries=retries,
+        timeout=timeout,
+        max_backoff=max_backoff,
+        max_host_failures=max_host_failures,
     )
 
+    # upload times are only needed to skip recently released versions
+    finder._link_collector.collect_upload_times = cooldown_days > 0
+    finder._link_collector.json_only = json_index
+    # fetch a project's pages from all indexes at once, unless the asyncio
+    # engine already fetched them together
+    if engine != 'asyncio':
+        finder._link_collector.jobs = jobs
+
+    try:
+        _update_requirements(
+            obuffer, updates,
+            input_file=input_file,
+            output_buffer=obuffer if output_file else None,
+            output_file=output_file,
+            force=force,
+            interactive=interactive,
+            skip=skip,
+            skip_gt=skip_gt,
+            only=only,
+            minor=minor,
+            patch=patch,
+            pre=pre,
+            dry_run=dry_run,
+            dry_run_changed=dry_run_changed,
+            no_recursive=no_recursive,
+            echo=echo,
+            index_urls=index_urls,
+            cert=cert,
+            no_ssl_verify=no_ssl_verify,
+            cooldown_days=cooldown_days,
+            jobs=jobs,
+            engine=engine,
+            session=session,
+            finder=finder,
+            requirement_cache=requirement_cache,
+        )
+    finally:
+        finder._link_collector.close()
+        session.close()
+
     if not dry_run or output_file:
         if not output_file:
             output_file = input_file
@@ -252,7 +393,8 @@ def _update_requirements(obuffer, updates, input_file=None,
                          dry_run=False, dry_run_changed=False,
                          echo=False, index_urls=[], cert=None,
                          no_recursive=False, no_ssl_verify=False,
-                         cooldown_days=0):
+                         cooldown_days=0, jobs=None, engine='threads',
+                         session=None, finder=None, requirement_cache=None):
     global PUR_GLOBAL_UPDATED
 
     updated = 0
@@ -278,10 +420,15 @@ def _update_requirements(obuffer, updates, input_file=None,
         dry_run=dry_run,
         dry_run_changed=dry_run_changed,
         cooldown_days=cooldown_days,
+        jobs=jobs,
+        engine=engine,
+        session=session,
+        finder=finder,
+        requirement_cache=requirement_cache,
     )
 
     stop = False
-    for line, req, spec_ver, latest_ver in requirements:
+    for line, req, spec_ver, latest_ver, retries in requirements:
 
         if not stop and can_check_version(req, spec_ver, skip, skip_gt, only):
 
@@ -320,6 +467,7 @@ def _update_requirements(obuffer, updates, input_file=None,
                         'latest': latest_ver,
                         'updated': was_updated,
                         'message': msg,
+                        'retries': retries,
                     })
                     if echo and not dry_run:
                         _echo(msg)
@@ -355,30 +503,23 @@ def _get_requirements_and_latest(filename, updates=[], force=False,
                                  no_recursive=False, output_file=None,
                                  output_buffer=None, echo=False,
                                  dry_run=False, dry_run_changed=False,
-                                 cooldown_days=0):
+                                 cooldown_days=0, jobs=None, engine='threads',
+                                 session=None, finder=None,
+                                 requirement_cache=None):
     """Parse a requirements file and get latest version for each requirement.
 
-    Yields a tuple of (original line, InstallRequirement instance,
-    spec_versions, latest_version).
-    """
+    Yields a tuple of (original line, PurRequirement instance,
+    spec_versions, latest_version, retries) where retries is the number of
+    requests retried while looking up the latest version.
 
-    index_urls = index_urls or [PyPI.simple_url]
+    When jobs is greater than one or using the asyncio engine, requirements
+    are first collected from the file then their latest versions are looked
+    up concurrently. Tuples are still yielded in the same order as the
+    requirements file.
+    """
 
-    session = PipSession(
-        index_urls=index_urls,
-    )
-    if cert:
-        session.verify = cert
-    if no_ssl_verify:
-        session.verify = False
-    session.auth.prompting = interactive
-
-    finder = build_package_finder(
-        session=session,
-        index_urls=index_urls,
-    )
-    if pre:
-        finder.set_allow_all_prereleases()
+    if jobs is None:
+        jobs = ASYNC_DEFAULT_JOBS if engine == 'asyncio' else 1
 
     requirements = _parse_requirements(
         filename, finder, session,
@@ -401,65 +542,219 @@ def _get_requirements_and_latest(filename, updates=[], force=False,
         dry_run=dry_run,
         dry_run_changed=dry_run_changed,
         cooldown_days=cooldown_days,
+        jobs=jobs,
+        engine=engine,
+        requirement_cache=requirement_cache,
     )
 
-    for parsed_req, orig_line in requirements:
-        if parsed_req is None:
-            yield (orig_line, None, None, None)
-            continue
+    lookup = partial(_latest_version_and_stats, finder=finder, minor=minor, patch=patch,
+                     pre=pre, cooldown_days=cooldown_days, session=session)
+
+    client = None
+    executor = None
+    if engine == 'asyncio':
+        client = AsyncIndexClient(session, limit=jobs,
+                                  json_only=finder._link_collector.json_only)
+    elif jobs > 1:
+        executor = ThreadPoolExecutor(max_workers=jobs)
+
+    # only lookups running in threads wait on new connections
+    preconnected = executor is None
+
+    def preconnect(req):
+        # connect to the indexes while the rest of the file is parsed,
+        # once we know at least one page isn't already cached
+        nonlocal preconnected
+        if not preconnected:
+            preconnected = True
+            _preconnect(session, finder, req.name, jobs)
+
+    def resolve_pending():
+        if client is not None:
+            finder._link_collector.prefetch(client, [
+                item[2].name for item in pending if item[2] is not None
+            ])
+        yield from _resolve_pending_requirements(pending)
 
-        install_req = install_req_from_parsed_requirement(
-            parsed_req,
-            user_supplied=True,
-        )
+    try:
+        pending = []
+        for parsed_req, orig_line in requirements:
+            if orig_line is not None:
+                pending.append(_get_pending_requirement(
+                    parsed_req, orig_line, lookup, executor,
+                    only=only, on_lookup=preconnect,
+                    requirement_cache=requirement_cache,
+                ))
+
+            # resolve pending lookups before a nested requirements file or
+            # an option line changes which index is used
+            if orig_line is None or (executor is None and client is None):
+                yield from resolve_pending()
+
+        yield from resolve_pending()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def _build_session_and_finder(index_urls=[], cert=None, no_ssl_verify=False,
+                              interactive=False, pre=[], cache_dir=None,
+                              index_ttl=0, pool_maxsize=None, retries=0,
+                              timeout=None, max_backoff=DEFAULT_MAX_BACKOFF,
+                              max_host_failures=0):
+    """Returns a tuple of (PurSession, PackageFinder) for looking up the
+    latest versions of packages.
+    """
+
+    index_urls = index_urls or [PyPI.simple_url]
+
+    session = PurSession(
+        index_urls=index_urls,
+        cache=cache_dir,
+        index_ttl=index_ttl,
+        pool_maxsize=max(pool_maxsize or 0, DEFAULT_POOLSIZE),
+        retries=retries,
+        timeout=timeout,
+        max_backoff=max_backoff,
+        max_host_failures=max_host_failures,
+    )
+    if cert:
+        session.verify = cert
+    if no_ssl_verify:
+        session.verify = False
+    session.auth.prompting = interactive
+
+    finder = build_package_finder(
+        session=session,
+        index_urls=index_urls,
+    )
+    if pre:
+        finder.set_allow_all_prereleases()
+
+    return session, finder
+
+
+def _get_pending_requirement(parsed_req, orig_line, lookup, executor,
+                             only=[], on_lookup=None,
+                             requirement_cache=None):
+    """Returns a tuple of (original line, ParsedRequirement instance,
+    PurRequirement instance, spec_versions, result) where result is a
+    callable returning the latest version, or None when the line should be
+    written without checking for updates.
+    """
+
+    if parsed_req is None:
+        return (orig_line, None, None, None, None)
+
+    req = parse_requirement(parsed_req, cache=requirement_cache)
+
+    if req is None or SCHEME_RE.match(req.name):
+        return (orig_line, None, None, None, None)
+
+    # skip checking pypi for excluded packages
+    if len(only) > 0 and req.name.lower() not in only:
+        return (orig_line, None, None, None, None)
+
+    spec_ver = req.spec_ver
+    if on_lookup is not None:
+        on_lookup(req)
+    if executor is None:
+        result = partial(lookup, req, spec_ver)
+    else:
+        result = executor.submit(lookup, req, spec_ver).result
+    return (orig_line, parsed_req, req, spec_ver, result)
 
-        if install_req.name is None or SCHEME_RE.match(install_req.name):
-            yield (orig_line, None, None, None)
-            continue
 
-        # skip checking pypi for excluded packages
-        if len(only) > 0 and install_req.name.lower() not in only:
-            yield (orig_line, None, None, None)
+def _preconnect(session, finder, project_name, jobs):
+    """Opens connections to the index hosts, unless the index pages for
+    project_name can be answered from the cache.
+    """
+
+    urls = finder.search_scope.get_index_urls_locations(project_name)
+    if urls and all(session.is_cached(url) for url in urls):
+        return
+    session.preconnect(finder.index_urls, connections=min(jobs, PRECONNECT_MAX))
+
+
+def _resolve_pending_requirements(pending):
+    """Waits for the latest version of each pending requirement, yielding
+    them in the same order they were added then clearing the pending list.
+    """
+
+    for orig_line, parsed_req, req, spec_ver, result in pending:
+        if result is None:
+            yield (orig_line, None, None, None, 0)
             continue
 
-        spec_ver = current_version(install_req)
-        if spec_ver or force:
-            try:
-                latest_ver = latest_version(install_req, spec_ver, finder, minor=minor, patch=patch, pre=pre,
-                                            cooldown_days=cooldown_days, session=session)
-            except InvalidPackage:
-                latest_ver = None
-
-                # output warning for invalid package
-                if not parsed_req.is_editable:
-                    _echo(
-                        'No matching distribution found for {req_name} from {comes_from}'.format(
-                            req_name=parsed_req.requirement,
-                            comes_from=parsed_req.comes_from,
-                        ),
-                        err=True,
-                        fg='red',
-                    )
+        try:
+            latest_ver, stats = result()
+        except InvalidPackage as e:
+            latest_ver, stats = None, getattr(e, 'request_stats', None)
+
+            # output warning for invalid package
+            if not parsed_req.is_editable:
+                _echo(
+                    'No matching distribution found for {req_name} from {comes_from}'.format(
+                        req_name=parsed_req.requirement,
+                        comes_from=parsed_req.comes_from,
+                    ),
+                    err=True,
+                    fg='red',
+                )
+
+        if stats is not None and stats.unreachable_hosts:
+            _echo(
+                'Could not reach {hosts} for {req_name}, latest version may be stale'.format(
+                    hosts=', '.join(sorted(stats.unreachable_hosts)),
+                    req_name=req.name,
+                ),
+                err=True,
+                fg='yellow',
+            )
+
+        retries = stats.retries if stats is not None else 0
+        yield (orig_line, req, spec_ver, latest_ver, retries)
+
+    del pending[:]
 
-            yield (orig_line, install_req, spec_ver, latest_ver)
+
+def _latest_version_and_stats(req, spec_ver, session=None, **kwargs):
+    """Returns a tuple of (latest version, RequestStats) for the package.
+
+    InvalidPackage errors get the RequestStats as their request_stats.
+    """
+
+    with session.track_requests() as stats:
+        try:
+            latest_ver = latest_version(req, spec_ver, session=session, **kwargs)
+        except InvalidPackage as e:
+            e.request_stats = stats
+            raise
+    return latest_ver, stats
 
 
 def _parse_requirements(filename, finder, session, updates=None, **options):
-    line_parser = get_line_parser(finder)
+    line_parser = build_line_parser(finder)
     parser = PatchedRequirementsFileParser(session, line_parser)
     parser.pur_updates = updates
-    parser.pur_options = options
+    parser.pur_options = dict(options, finder=finder, session=session)
 
     constraint = False
     for parsed_line, orig_line in parser.parse(filename, constraint):
         if parsed_line is None:
             yield None, orig_line
             continue
+        if not parsed_line.is_requirement:
+            # option lines like --index-url change how later lines resolve
+            yield None, None
+            before = index_options(finder)
         parsed_req = handle_line(
             parsed_line,
             finder=finder,
             session=session
         )
+        if not parsed_line.is_requirement and index_options(finder) != before:
+            forget_found_candidates(finder)
         yield parsed_req, orig_line
 
 
@@ -482,17 +777,28 @@ class PatchedRequirementsFileParser(RequirementsFileParser):
                     yield None, orig_line
                     continue
 
+                # let pending lookups finish before updating the nested file
+                # so output stays in the same order as the requirements files
+                yield None, None
+
                 req_path = os.path.join(
                     os.path.dirname(filename), req_path,
                 )
 
                 buf = StringIO()
 
-                _update_requirements(
-                    buf, self.pur_updates,
-                    input_file=req_path,
-                    **self.pur_options,
-                )
+                # option lines in the nested file only apply to that file
+                finder = self.pur_options['finder']
+                finder_options = save_finder_options(finder)
+                try:
+                    _update_requirements(
+                        buf, self.pur_updates,
+                        input_file=req_path,
+                        **self.pur_options,
+                    )
+                finally:
+                    restore_finder_options(finder, finder_options,
+                                           session=self.pur_options['session'])
 
                 if not self.pur_options['dry_run']:
                     if self.pur_options['output_buffer']:
@@ -514,8 +820,18 @@ class PatchedRequirementsFileParser(RequirementsFileParser):
         lines_enum = enumerate(content.splitlines(), start=1)
         lines_enum = join_lines(lines_enum)
 
+        skip = self.pur_options['skip']
+        only = self.pur_options['only']
         for line_number, line, orig_line in lines_enum:
             line = COMMENT_RE.sub('', line)
+
+            # copy lines for excluded packages without parsing them
+            if skip or only:
+                name = requirement_name(line)
+                if name is not None and is_excluded(name, skip, only):
+                    yield None, orig_line
+                    continue
+
             try:
                 args_str, opts = self._line_parser(line)
             except OptionParsingError:
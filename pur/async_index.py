@@ -0,0 +1,486 @@
+# -*- coding: utf-8 -*-
+"""
+    pur.async_index
+    ~~~~~~~~~~~~~~~
+    Fetch package index pages concurrently on a single asyncio event loop.
+    :copyright: (c) 2016 Alan Hamlett.
+    :license: BSD, see LICENSE for more details.
+"""
+
+
+import asyncio
+import base64
+import gzip
+import os
+import ssl
+import urllib.parse
+import urllib.request
+import time
+import zlib
+from collections import defaultdict
+from email.utils import parsedate_tz, mktime_tz
+
+from pip._internal.index.collector import IndexContent, _get_encoding_from_headers
+from pip._vendor import certifi, requests
+from pip._vendor.cachecontrol import CacheControlAdapter
+from pip._vendor.urllib3 import HTTPResponse
+
+from .session import (DEFAULT_MAX_BACKOFF, JSON_API_CONTENT_TYPE,
+                      RETRY_BACKOFF_FACTOR, RETRY_STATUSES, host_of)
+
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+FAILED = object()
+ACCEPT_ENCODING = 'gzip, deflate'
+MAX_REDIRECTS = 10
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+SIMPLE_API_ACCEPT = ', '.join([
+    JSON_API_CONTENT_TYPE,
+    'application/vnd.pypi.simple.v1+html; q=0.1',
+    'text/html; q=0.01',
+])
+SIMPLE_API_CONTENT_TYPES = (
+    'text/html',
+    'application/vnd.pypi.simple.v1+html',
+    JSON_API_CONTENT_TYPE,
+)
+
+
+class AsyncIndexClient(object):
+    """Minimal HTTP/1.1 client fetching PEP 503 and PEP 691 project pages
+    concurrently, without one thread per request.
+
+    Pages which can't be fetched, for example because of an auth challenge,
+    a proxy or an unexpected response, are left out of the results so pip's
+    LinkCollector fetches them again with the PipSession. Connection errors,
+    timeouts and retryable statuses are retried the same way as the session
+    does, and the number of retries for each url fetched by the last
+    fetch_pages call is kept in retry_counts.
+    Each request is added to the session's host stats when it keeps them,
+    and hosts the session stopped using are left to the session.
+
+    When the session caches responses, pages are revalidated against and
+    stored in the same cache the session uses.
+    """
+
+    def __init__(self, session, limit=100, timeout=None, retries=None,
+                 max_backoff=None, json_only=False):
+        """
+        :param session:      A PipSession instance to take the User-Agent, TLS
+                             verification, default timeout and retries from.
+        :param limit:        Maximum number of requests in flight at once.
+        :param timeout:      Seconds to wait for each page, defaults to the
+                             session timeout.
+        :param retries:      Number of times to retry a failed page, defaults
+                             to the session retries.
+        :param max_backoff:  Most seconds to wait between retries, defaults to
+                             the session max_backoff.
+        :param json_only:    Only request PEP 691 JSON pages, leaving pages
+                             in other formats to the session.
+        """
+        self.session = session
+        self.user_agent = session.headers.get('User-Agent')
+        self.verify = session.verify
+        self.trust_env = session.trust_env
+        self.proxies = session.proxies
+        self.limit = limit
+        self.timeout = timeout if timeout is not None else session.timeout
+        if retries is None:
+            retries = getattr(session, 'retries', 0)
+        self.retries = retries
+        if max_backoff is None:
+            max_backoff = getattr(session, 'max_backoff', DEFAULT_MAX_BACKOFF)
+        self.max_backoff = max_backoff
+        if json_only:
+            self.accept = JSON_API_CONTENT_TYPE
+            self.content_types = (JSON_API_CONTENT_TYPE,)
+        else:
+            self.accept = SIMPLE_API_ACCEPT
+            self.content_types = SIMPLE_API_CONTENT_TYPES
+        self.retry_counts = {}
+        self._idle = defaultdict(list)
+        self._ssl_context = None
+
+    def fetch_pages(self, urls):
+        """Returns a dict mapping url to IndexContent for each fetched url,
+        or to None when the page still failed after using up all retries.
+
+        :param urls:  List of project page urls.
+        """
+
+        self.retry_counts = {}
+        urls = [url for url in dict.fromkeys(urls) if self.supports(url)]
+        if not urls:
+            return {}
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            # can't block inside a running event loop, so let pip fetch pages
+            return {}
+
+        try:
+            self._ssl_context = _ssl_context(self.verify, self.trust_env)
+        except (OSError, ssl.SSLError):
+            return {}
+
+        return asyncio.run(self._fetch_pages(urls))
+
+    def supports(self, url):
+        """Returns True if url can be fetched without going through a proxy.
+
+        :param url:  The url to check.
+        """
+
+        scheme = urllib.parse.urlsplit(url).scheme
+        if scheme not in DEFAULT_PORTS:
+            return False
+
+        if self.proxies.get(scheme) or self.proxies.get('all'):
+            return False
+        if self.trust_env:
+            proxies = urllib.request.getproxies()
+            if proxies.get(scheme) or proxies.get('all'):
+                host = urllib.parse.urlsplit(url).netloc.rpartition('@')[2]
+                if not urllib.request.proxy_bypass(host):
+                    return False
+
+        return True
+
+    async def _fetch_pages(self, urls):
+        semaphore = asyncio.Semaphore(self.limit)
+        try:
+            pages = await asyncio.gather(*[
+                self._fetch_page(url, semaphore) for url in urls
+            ])
+        finally:
+            self._close_idle()
+        return {
+            url: None if page is FAILED else page
+            for url, page in zip(urls, pages) if page is not None
+        }
+
+    def _is_host_down(self, host):
+        is_host_down = getattr(self.session, 'is_host_down', None)
+        return is_host_down is not None and is_host_down(host)
+
+    def _record_request(self, host, start, failed=False):
+        record_request = getattr(self.session, 'record_request', None)
+        if record_request is not None:
+            record_request(host, time.monotonic() - start, failed=failed)
+
+    def _backoff(self, retries, retry_after=None):
+        """Returns seconds to wait before the next attempt, matching
+        pur.session.PurRetry.
+        """
+
+        if retry_after:
+            seconds = _parse_retry_after(retry_after)
+        elif retries <= 1:
+            seconds = 0
+        else:
+            seconds = RETRY_BACKOFF_FACTOR * (2 ** (retries - 1))
+        if seconds is None:
+            seconds = 0
+        return min(seconds, self.max_backoff)
+
+    async def _fetch_page(self, url, semaphore):
+        cache = self._cache_request(url)
+        conditional_headers = {}
+        if cache is not None:
+            controller, cache_request = cache
+            conditional_headers = controller.conditional_headers(cache_request)
+
+        host = host_of(url)
+        delay = 0
+        async with semaphore:
+            for attempt in range(self.retries + 1):
+                if self._is_host_down(host):
+                    return None if attempt == 0 else FAILED
+                if attempt:
+                    self.retry_counts[url] = attempt
+                    await asyncio.sleep(delay)
+                start = time.monotonic()
+                try:
+                    get = self._get(url, conditional_headers)
+                    if self.timeout:
+                        response = await asyncio.wait_for(get, self.timeout)
+                    else:
+                        response = await get
+                except (OSError, EOFError, asyncio.TimeoutError):
+                    self._record_request(host, start, failed=True)
+                    response = None
+                    delay = self._backoff(attempt + 1)
+                    continue
+                except ValueError:
+                    return None
+
+                status, headers = response[0], response[1]
+                self._record_request(host, start, failed=status in RETRY_STATUSES)
+                if status not in RETRY_STATUSES:
+                    break
+                delay = self._backoff(attempt + 1, headers.get('retry-after'))
+            else:
+                # retries used up, so don't retry again with the session
+                if response is None or response[0] in RETRY_STATUSES:
+                    return FAILED
+
+        status, headers, body, final_url = response
+        if cache is not None and final_url == url:
+            try:
+                status, headers, body = _use_cache(
+                    controller, cache_request, status, headers, body,
+                )
+            except Exception:
+                return None
+        if status != 200:
+            return None
+
+        try:
+            body = _decode(body, headers.get('content-encoding', ''))
+        except zlib.error:
+            return None
+
+        content_type = headers.get('content-type', 'Unknown')
+        if not content_type.lower().startswith(self.content_types):
+            return None
+
+        return IndexContent(
+            body,
+            content_type,
+            encoding=_get_encoding_from_headers({'Content-Type': content_type}),
+            url=final_url,
+            cache_link_parsing=False,
+        )
+
+    def _cache_request(self, url):
+        """Returns a tuple of (CacheController, PreparedRequest) for looking
+        up url in the session's cache, or None when not caching.
+        """
+
+        adapter = self.session.get_adapter(url)
+        if not isinstance(adapter, CacheControlAdapter):
+            return None
+        request = requests.Request('GET', url, headers={
+            'Accept': self.accept,
+            'Accept-Encoding': ACCEPT_ENCODING,
+            'Cache-Control': 'max-age=0',
+        }).prepare()
+        return adapter.controller, request
+
+    async def _get(self, url, extra_headers=None):
+        for _ in range(MAX_REDIRECTS + 1):
+            status, headers, body = await self._request(url, extra_headers)
+            location = headers.get('location')
+            if status not in REDIRECT_STATUSES or not location:
+                return status, headers, body, url
+            # conditional headers only apply to the first url
+            extra_headers = None
+            url = urllib.parse.urljoin(url, location)
+            if not self.supports(url):
+                raise ValueError('Unsupported redirect to {0}'.format(url))
+        raise ValueError('Exceeded {0} redirects'.format(MAX_REDIRECTS))
+
+    async def _request(self, url, extra_headers=None):
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or DEFAULT_PORTS[parts.scheme])
+        request = self._build_request(parts, extra_headers)
+
+        while True:
+            reader, writer, reused = await self._connect(key)
+            try:
+                writer.write(request)
+                await writer.drain()
+                status, headers, body, reusable = await _read_response(reader)
+            except (OSError, EOFError):
+                writer.close()
+                # the server may have closed an idle keep-alive connection
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                writer.close()
+                raise
+            break
+
+        if reusable:
+            self._idle[key].append((reader, writer))
+        else:
+            writer.close()
+        return status, headers, body
+
+    def _build_request(self, parts, extra_headers=None):
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        userinfo, _, host = parts.netloc.rpartition('@')
+        lines = [
+            'GET {0} HTTP/1.1'.format(path),
+            'Host: {0}'.format(host),
+            'Accept: {0}'.format(self.accept),
+            'Accept-Encoding: {0}'.format(ACCEPT_ENCODING),
+            'Cache-Control: max-age=0',
+        ]
+        for name, value in (extra_headers or {}).items():
+            lines.append('{0}: {1}'.format(name, value))
+        if self.user_agent:
+            lines.append('User-Agent: {0}'.format(self.user_agent))
+        if userinfo:
+            username, _, password = userinfo.partition(':')
+            credentials = '{0}:{1}'.format(
+                urllib.parse.unquote(username),
+                urllib.parse.unquote(password),
+            )
+            lines.append('Authorization: Basic {0}'.format(
+                base64.b64encode(credentials.encode('utf-8')).decode('ascii'),
+            ))
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def _connect(self, key):
+        idle = self._idle[key]
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+
+        scheme, host, port = key
+        reader, writer = await asyncio.open_connection(
+            host, port,
+            ssl=self._ssl_context if scheme == 'https' else None,
+        )
+        return reader, writer, False
+
+    def _close_idle(self):
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+
+async def _read_response(reader):
+    """Reads one HTTP/1.1 response from reader.
+
+    Returns a tuple of (status, headers, body, reusable) where headers is a
+    dict with lowercase names, body is still content-encoded and reusable is
+    True when the connection can be used for another request.
+    """
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise EOFError('Connection closed before response')
+    parts = status_line.decode('latin-1').split(None, 2)
+    if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+        raise ValueError('Invalid status line: {0!r}'.format(status_line))
+    version, status = parts[0], int(parts[1])
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        if name in headers:
+            headers[name] += ', ' + value.strip()
+        else:
+            headers[name] = value.strip()
+
+    reusable = (version == 'HTTP/1.1' and
+                'close' not in headers.get('connection', '').lower())
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        body = await _read_chunked(reader)
+    elif 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+    elif status in (204, 304) or status < 200:
+        body = b''
+    else:
+        body = await reader.read()
+        reusable = False
+
+    return status, headers, body, reusable
+
+
+def _decode(body, content_encoding):
+    content_encoding = content_encoding.lower()
+    if content_encoding == 'gzip':
+        return gzip.decompress(body)
+    if content_encoding == 'deflate':
+        return zlib.decompress(body)
+    return body
+
+
+def _use_cache(controller, request, status, headers, body):
+    """Stores a fetched page in the cache, or returns the cached page when
+    the server answered 304 Not Modified.
+
+    Returns a tuple of (status, headers, body) for the page.
+    """
+
+    response = HTTPResponse(
+        body=b'',
+        headers=headers,
+        status=status,
+        version=11,
+        reason='',
+        preload_content=False,
+    )
+    if status == 304:
+        cached = controller.update_cached_response(request, response)
+        if cached is response:
+            return status, headers, body
+        headers = {k.lower(): v for k, v in cached.headers.items()}
+        return 200, headers, cached.read(decode_content=False)
+
+    if status == 200:
+        controller.cache_response(request, response, body)
+    return status, headers, body
+
+
+async def _read_chunked(reader):
+    chunks = []
+    while True:
+        size = int((await reader.readline()).split(b';', 1)[0].strip(), 16)
+        if size == 0:
+            break
+        chunks.append(await reader.readexactly(size))
+        await reader.readexactly(2)
+
+    # skip trailer headers
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+
+    return b''.join(chunks)
+
+
+def _parse_retry_after(value):
+    if value.strip().isdigit():
+        return int(value)
+    date = parsedate_tz(value)
+    if date is None:
+        return None
+    return max(0, mktime_tz(date) - time.time())
+
+
+def _ssl_context(verify, trust_env=True):
+    if verify is False:
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        return context
+
+    if verify is True or not verify:
+        verify = None
+        if trust_env:
+            verify = (os.environ.get('REQUESTS_CA_BUNDLE') or
+                      os.environ.get('CURL_CA_BUNDLE'))
+        verify = verify or certifi.where()
+
+    if os.path.isdir(verify):
+        return ssl.create_default_context(capath=verify)
+    return ssl.create_default_context(cafile=verify)
@@ -0,0 +1,685 @@
+# -*- coding: utf-8 -*-
+"""
+    pur.index
+    ~~~~~~~~~
+    Collect links to package versions from package indexes.
+    :copyright: (c) 2016 Alan Hamlett.
+    :license: BSD, see LICENSE for more details.
+"""
+
+
+import codecs
+import functools
+import html
+import json
+import logging
+import re
+import sys
+import urllib.parse
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime, timezone
+
+from pip._internal.exceptions import NetworkConnectionError
+from pip._internal.index.collector import (HTMLLinkParser, LinkCollector,
+                                           _make_index_content)
+from pip._internal.index.package_finder import (CandidateEvaluator, LinkType,
+                                                PackageFinder,
+                                                _extract_version_from_fragment,
+                                                filter_unallowed_hashes)
+from pip._internal.models.candidate import InstallationCandidate
+from pip._internal.models.link import Link
+from pip._internal.network.utils import raise_for_status
+from pip._internal.utils.filetypes import WHEEL_EXTENSION
+from pip._internal.utils.misc import splitext
+from pip._internal.utils.packaging import check_requires_python
+from pip._vendor import requests
+from pip._vendor.packaging.specifiers import InvalidSpecifier, SpecifierSet
+
+from .session import JSON_API_CONTENT_TYPE, host_of
+from .versions import parse_version
+
+
+logger = logging.getLogger(__name__)
+finder_logger = logging.getLogger('pip._internal.index.package_finder')
+
+MISSING = object()
+# how much of an HTML index page is parsed at a time
+PARSE_CHUNK_SIZE = 64 * 1024
+# PEP 503 project pages are a list of anchors, which are scanned with these
+# instead of HTMLParser when nothing else on the page could change the links
+ATTRIBUTE_PATTERN = rb'''\s+([^\s"'>/=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+)))?'''
+ATTRIBUTE_RE = re.compile(ATTRIBUTE_PATTERN)
+ANCHOR_RE = re.compile(rb'<a((?:' + ATTRIBUTE_PATTERN + rb')*)\s*/?>', re.IGNORECASE)
+ANCHOR_START_RE = re.compile(rb'<a[\s/>]', re.IGNORECASE)
+UNSCANNABLE_RE = re.compile(
+    rb'<(?:base|script|style)[\s/>]|<!\[CDATA\[|<!--(?:(?!-->).)*?<a[\s/>]',
+    re.IGNORECASE | re.DOTALL,
+)
+SCANNABLE_ENCODINGS = ('utf-8', 'ascii', 'iso8859-1', 'cp1252')
+
+# supported wheel tags for each target python, shared by all finders
+_supported_tags = {}
+
+# distinct Requires-Python values whose result is remembered, projects only
+# use a handful of them across all of their files
+REQUIRES_PYTHON_CACHE_SIZE = 1024
+
+
+class PurCandidate(InstallationCandidate):
+    """InstallationCandidate taking its version from parse_version, so each
+    distinct version string is parsed once.
+
+    find_all_candidates is cached for the whole run, so instead of keeping a
+    Link, which references the index page and all of its content, only the
+    fields pur reads are kept in slots. The Link is built again when needed.
+    """
+
+    __slots__ = ('_url', '_page_url', '_requires_python', '_yanked_reason',
+                 '_hashes')
+
+    def __init__(self, name, version, link, requires_python=None):
+        self.name = name
+        self.version = parse_version(version)
+        self._url = link.url
+        self._page_url = getattr(link.comes_from, 'url', link.comes_from)
+        requires_python = requires_python or link.requires_python
+        self._requires_python = requires_python and sys.intern(requires_python)
+        self._yanked_reason = link.yanked_reason
+        # hashes from the url fragment are parsed again with the url
+        self._hashes = link._hashes or None
+        super(InstallationCandidate, self).__init__(
+            key=(self.name, self.version, self._url),
+            defining_class=InstallationCandidate,
+        )
+
+    @property
+    def link(self):
+        return Link(
+            self._url,
+            comes_from=self._page_url,
+            requires_python=self._requires_python,
+            yanked_reason=self._yanked_reason,
+            hashes=self._hashes,
+        )
+
+    @property
+    def is_yanked(self):
+        return self._yanked_reason is not None
+
+    @property
+    def is_wheel(self):
+        path = urllib.parse.urlsplit(self._url).path
+        return path.endswith(WHEEL_EXTENSION)
+
+
+class PurCandidateEvaluator(CandidateEvaluator):
+    """CandidateEvaluator which ranks candidates only by allowed hash, not
+    yanked, wheel when binaries are preferred and version.
+
+    pur wants the latest version, not the best file to install, so the
+    wheel tag ranking pip builds for every evaluator is skipped.
+    """
+
+    @classmethod
+    def create(cls, project_name, target_python=None, prefer_binary=False,
+               allow_all_prereleases=False, specifier=None, hashes=None):
+        if specifier is None:
+            specifier = SpecifierSet()
+        return cls(
+            project_name=project_name,
+            supported_tags=[],
+            specifier=specifier,
+            prefer_binary=prefer_binary,
+            allow_all_prereleases=allow_all_prereleases,
+            hashes=hashes,
+        )
+
+    def get_applicable_candidates(self, candidates):
+        # same as pip, but filtering Version objects instead of turning them
+        # into strings which the specifier parses again
+        allow_prereleases = self._allow_all_prereleases or None
+        versions = set(self._specifier.filter(
+            {candidate.version for candidate in candidates},
+            prereleases=allow_prereleases,
+        ))
+        applicable_candidates = [c for c in candidates if c.version in versions]
+        filtered_applicable_candidates = filter_unallowed_hashes(
+            candidates=applicable_candidates,
+            hashes=self._hashes,
+            project_name=self._project_name,
+        )
+        return sorted(filtered_applicable_candidates, key=self._sort_key)
+
+    def _sort_key(self, candidate):
+        # only build a PurCandidate's Link when there are hashes to check
+        if isinstance(candidate, PurCandidate):
+            is_yanked, is_wheel = candidate.is_yanked, candidate.is_wheel
+        else:
+            is_yanked, is_wheel = candidate.link.is_yanked, candidate.link.is_wheel
+        return (
+            bool(self._hashes) and candidate.link.is_hash_allowed(self._hashes),
+            not is_yanked,
+            self._prefer_binary and is_wheel,
+            candidate.version,
+        )
+
+
+class PurPackageFinder(PackageFinder):
+    """PackageFinder which parses and evaluates index pages one file at a
+    time, using iter_files, instead of parsing every link on a page before
+    evaluating them.
+
+    pur only needs each version once, so after a file is found for a version
+    other files for the same version are skipped by file name, without
+    building a Link or InstallationCandidate for them. Files which are
+    yanked, need another Python or are wheels for other platforms are skipped
+    the same way. Candidates are yielded as they're found.
+
+    Candidates are ranked with PurCandidateEvaluator, and the VersionIndex
+    of each project's candidates is kept in version_indexes.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version_indexes = {}
+
+    def make_candidate_evaluator(self, project_name, specifier=None, hashes=None):
+        candidate_prefs = self._candidate_prefs
+        return PurCandidateEvaluator.create(
+            project_name=project_name,
+            target_python=self._target_python,
+            prefer_binary=candidate_prefs.prefer_binary,
+            allow_all_prereleases=candidate_prefs.allow_all_prereleases,
+            specifier=specifier,
+            hashes=hashes,
+        )
+
+    def process_project_url(self, project_url, link_evaluator):
+        logger.debug('Fetching project page and analyzing links: %s', project_url)
+        page = self._link_collector.fetch_response(project_url)
+        if page is None:
+            return []
+        return self.iter_candidates(link_evaluator, page, iter_files(page))
+
+    def iter_candidates(self, link_evaluator, page, files):
+        """Yields an InstallationCandidate for the first file found for each
+        version.
+
+        :param link_evaluator:  A LinkEvaluator for the project.
+        :param page:            The IndexContent the files are from.
+        :param files:           Iterable of IndexFile instances.
+        """
+
+        canonical_name = link_evaluator._canonical_name
+        found = set()
+        for file in files:
+            version = file_version(file.filename, canonical_name)
+            if version is not None and version in found:
+                continue
+            if self._is_skipped(link_evaluator, file):
+                continue
+
+            link = file.link(page.url)
+            if link is None:
+                continue
+            # _is_skipped already checked Requires-Python, so hide it from
+            # the evaluator which would parse it again for every link
+            link.requires_python = None
+            candidate = self.get_install_candidate(
+                link_evaluator, link, requires_python=file.requires_python)
+            if candidate is None:
+                continue
+            if version is not None:
+                found.add(version)
+            yield candidate
+
+    def get_install_candidate(self, link_evaluator, link, requires_python=None):
+        result, detail = link_evaluator.evaluate_link(link)
+        if result != LinkType.candidate:
+            self._log_skipped_link(link, result, detail)
+            return None
+        return PurCandidate(
+            name=link_evaluator.project_name,
+            version=detail,
+            link=link,
+            requires_python=requires_python,
+        )
+
+    def _is_skipped(self, link_evaluator, file):
+        """Returns True when LinkEvaluator would skip file, checking only what
+        can be known without a Link.
+        """
+
+        if file.yanked_reason is not None and not link_evaluator._allow_yanked:
+            return True
+
+        if file.requires_python and not link_evaluator._ignore_requires_python:
+            if supports_requires_python(
+                file.requires_python,
+                link_evaluator._target_python.py_version_info,
+            ) is False:
+                return True
+
+        if file.filename.endswith('.whl'):
+            tags = _wheel_tags(file.filename)
+            if tags is not None:
+                return supported_tags(self._target_python).isdisjoint(tags)
+
+        return False
+
+    def _log_skipped_link(self, link, result, detail):
+        # pip remembers every skipped link so each is logged once, which
+        # keeps all of them in memory
+        if finder_logger.isEnabledFor(logging.DEBUG):
+            super()._log_skipped_link(link, result, detail)
+
+
+class PurLinkCollector(LinkCollector):
+    """LinkCollector which serves project pages fetched ahead of time, for
+    example by pur.async_index.AsyncIndexClient, before falling back to
+    fetching pages one at a time with the PipSession.
+
+    When a project is found on more than one index, the pages from the
+    other indexes are fetched in parallel while the first index is fetched
+    by the calling thread, so each project costs the slowest index instead
+    of the sum of all of them. Set jobs to the number of projects looked up
+    at once, or 0 to fetch indexes one after another.
+
+    When collect_upload_times is set, upload times from PEP 700 JSON project
+    pages are kept in upload_times, mapping page url to a dict of file name
+    to a timezone-aware datetime.
+
+    When json_only is set, index pages are requested as PEP 691 JSON only,
+    without pip's HEAD request for urls which look like archives, and pages
+    in other formats are skipped.
+    """
+
+    def __init__(self, session, search_scope):
+        super().__init__(session=session, search_scope=search_scope)
+        self.prefetched = {}
+        self.prefetched_retries = {}
+        self.collect_upload_times = False
+        self.upload_times = {}
+        self.release_dates = {}
+        self.jobs = 0
+        self.json_only = False
+        self._executor = None
+        self._prefetched_projects = set()
+
+    def collect_sources(self, project_name, candidates_from_page):
+        sources = super().collect_sources(project_name, candidates_from_page)
+        if self.jobs:
+            self._fetch_in_parallel(project_name)
+        return sources
+
+    def fetch_response(self, location):
+        url = location.url.split('#', 1)[0]
+        stats = None
+        unreachable_host = None
+        retries = self.prefetched_retries.pop(url, 0)
+        # None when the prefetch gave up after retrying
+        page = self.prefetched.pop(url, MISSING)
+        if isinstance(page, Future):
+            page, stats = page.result()
+        elif page is MISSING:
+            page = self._fetch_response(location)
+        elif page is None:
+            unreachable_host = host_of(url)
+        add_request_stats = getattr(self.session, 'add_request_stats', None)
+        if add_request_stats is not None:
+            add_request_stats(stats, retries=retries, unreachable_host=unreachable_host)
+        if page is not None and self.collect_upload_times:
+            self.upload_times[page.url] = get_upload_times(page)
+        return page
+
+    def close(self):
+        """Waits for pages still being fetched in parallel."""
+
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def reset(self):
+        """Forget which projects were prefetched, for example after the
+        index urls changed.
+        """
+
+        self._prefetched_projects.clear()
+
+    def _fetch_in_parallel(self, project_name):
+        urls = [
+            url for url in self.search_scope.get_index_urls_locations(project_name)
+            if url.startswith(('https://', 'http://')) and
+            self.session.is_secure_origin(Link(url))
+        ]
+        if len(urls) < 2:
+            return
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.jobs * (len(urls) - 1),
+            )
+        # the calling thread fetches the first index itself
+        for url in urls[1:]:
+            if url not in self.prefetched:
+                self.prefetched[url] = self._executor.submit(self._fetch, url)
+
+    def _fetch(self, url):
+        track_requests = getattr(self.session, 'track_requests', None)
+        with track_requests() if track_requests else nullcontext() as stats:
+            page = self._fetch_response(Link(url))
+        return page, stats
+
+    def _fetch_response(self, location):
+        if self.json_only and location.scheme in ('http', 'https'):
+            return get_json_index_content(location, self.session)
+        return super().fetch_response(location)
+
+    def prefetch(self, client, project_names):
+        """Fetch the index pages for all projects at once using client.
+
+        Projects already prefetched are skipped, since PackageFinder caches
+        the candidates found for each project, as are pages the session can
+        answer from its cache.
+
+        :param client:         An object with a fetch_pages(urls) method
+                               returning a dict of url to IndexContent.
+        :param project_names:  Iterable of project names.
+        """
+
+        urls = []
+        for project_name in project_names:
+            if project_name in self._prefetched_projects:
+                continue
+            self._prefetched_projects.add(project_name)
+            urls.extend(self.search_scope.get_index_urls_locations(project_name))
+
+        is_cached = getattr(self.session, 'is_cached', None)
+        if is_cached is not None:
+            urls = [url for url in urls if not is_cached(url)]
+
+        if urls:
+            self.prefetched.update(client.fetch_pages(urls))
+            self.prefetched_retries.update(getattr(client, 'retry_counts', {}))
+
+
+def get_json_index_content(link, session):
+    """Returns the PEP 691 JSON project page at link as IndexContent, or None
+    when it can't be fetched or isn't JSON.
+
+    Unlike pip's _get_index_content, only JSON is accepted and no HEAD request
+    is sent first.
+
+    :param link:     Link to a project page on a package index.
+    :param session:  PipSession instance.
+    """
+
+    url = link.url.split('#', 1)[0]
+    try:
+        response = session.get(url, headers={
+            'Accept': JSON_API_CONTENT_TYPE,
+            # revalidate cached pages, same as pip
+            'Cache-Control': 'max-age=0',
+        })
+        raise_for_status(response)
+    except (NetworkConnectionError, requests.RequestException) as e:
+        logger.debug('Could not fetch URL %s: %s - skipping', link, e)
+        return None
+
+    content_type = response.headers.get('Content-Type', 'Unknown')
+    if not content_type.lower().startswith(JSON_API_CONTENT_TYPE):
+        logger.warning('Skipping page %s because it is not a PEP 691 JSON page: %s',
+                       link, content_type)
+        return None
+
+    return _make_index_content(response, cache_link_parsing=link.cache_link_parsing)
+
+
+class IndexFile(object):
+    """One file listed on an index page, holding what's needed to decide if
+    a Link should be built for it.
+    """
+
+    __slots__ = ('filename', 'requires_python', 'yanked_reason', 'data', 'base_url')
+
+    def __init__(self, filename, requires_python, yanked_reason, data, base_url=None):
+        self.filename = filename
+        self.requires_python = requires_python
+        self.yanked_reason = yanked_reason
+        self.data = data
+        self.base_url = base_url
+
+    @classmethod
+    def from_json(cls, file):
+        # same as Link.from_json
+        yanked = file.get('yanked')
+        if yanked and not isinstance(yanked, str):
+            yanked = ''
+        elif not yanked:
+            yanked = None
+        return cls(file.get('filename') or '', file.get('requires-python'), yanked, file)
+
+    @classmethod
+    def from_element(cls, anchor, base_url):
+        href = anchor.get('href') or ''
+        path = urllib.parse.urlsplit(href).path.rstrip('/')
+        filename = urllib.parse.unquote(path.rpartition('/')[2])
+        return cls(filename, anchor.get('data-requires-python'),
+                   anchor.get('data-yanked'), anchor, base_url)
+
+    def link(self, page_url):
+        """Returns a Link for the file, or None when it has no url."""
+
+        if self.base_url is None:
+            return Link.from_json(self.data, page_url)
+        return Link.from_element(self.data, page_url=page_url, base_url=self.base_url)
+
+
+def iter_links(page, chunk_size=PARSE_CHUNK_SIZE):
+    """Yields a Link for each file on an index page, same as pip's
+    parse_links, but parses HTML pages chunk_size bytes at a time.
+
+    :param page:        An IndexContent instance.
+    :param chunk_size:  Number of bytes of HTML to parse at a time.
+    """
+
+    for file in iter_files(page, chunk_size=chunk_size):
+        link = file.link(page.url)
+        if link is not None:
+            yield link
+
+
+def iter_files(page, chunk_size=PARSE_CHUNK_SIZE):
+    """Yields an IndexFile for each file on an index page. JSON pages are
+    decoded at once with json.loads, HTML pages are parsed chunk_size bytes
+    at a time.
+
+    HTML pages which are only a list of anchors, like PEP 503 pages, are
+    scanned with regular expressions instead of HTMLParser, which takes over
+    from the first anchor the expressions don't match.
+
+    :param page:        An IndexContent instance.
+    :param chunk_size:  Number of bytes of HTML to parse at a time.
+    """
+
+    if page.content_type.lower().startswith(JSON_API_CONTENT_TYPE):
+        for file in json.loads(page.content).get('files', []):
+            yield IndexFile.from_json(file)
+        return
+
+    parser = _LinkParser(page.url)
+    if _is_scannable(page):
+        encoding = page.encoding or 'utf-8'
+        for anchor in _scan_anchors(page.content, encoding):
+            if anchor is None:
+                break
+            # the parser skips anchors already scanned if it has to take over
+            parser.skip += 1
+            yield IndexFile.from_element(anchor, page.url)
+        else:
+            return
+
+    decoder = codecs.getincrementaldecoder(page.encoding or 'utf-8')()
+    for chunk in _chunks(page.content, chunk_size):
+        parser.feed(decoder.decode(chunk))
+        yield from _parsed_files(parser)
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    yield from _parsed_files(parser)
+
+
+def supported_tags(target_python):
+    """Returns a frozenset of (interpreter, abi, platform) tuples for the
+    wheel tags target_python supports, computed once per process for each
+    distinct target python.
+
+    :param target_python:  A TargetPython instance.
+    """
+
+    key = (
+        target_python._given_py_version_info,
+        tuple(target_python.platforms or ()),
+        tuple(target_python.abis or ()),
+        target_python.implementation,
+    )
+    tags = _supported_tags.get(key)
+    if tags is None:
+        tags = _supported_tags[key] = frozenset(
+            (tag.interpreter, tag.abi, tag.platform)
+            for tag in target_python.get_tags()
+        )
+    return tags
+
+
+@functools.lru_cache(maxsize=REQUIRES_PYTHON_CACHE_SIZE)
+def supports_requires_python(requires_python, version_info):
+    """Returns True when a Python of version_info satisfies requires_python,
+    False when it doesn't and None when requires_python isn't a valid
+    specifier, parsing each distinct value once for the whole run.
+
+    :param requires_python:  A Requires-Python specifier string.
+    :param version_info:     A tuple of ints for the target Python version.
+    """
+
+    try:
+        return check_requires_python(requires_python, version_info=version_info)
+    except InvalidSpecifier:
+        return None
+
+
+def file_version(filename, canonical_name):
+    """Returns the version string in a wheel or sdist file name, or None when
+    it can't be found without building a Link.
+
+    :param filename:        Name of a distribution file.
+    :param canonical_name:  Canonical name of the project the file is for.
+    """
+
+    if filename.endswith('.whl'):
+        parts = filename[:-4].split('-')
+        if len(parts) not in (5, 6):
+            return None
+        return parts[1].replace('_', '-')
+    stem, ext = splitext(filename)
+    if not ext:
+        return None
+    return _extract_version_from_fragment(stem, canonical_name)
+
+
+class _LinkParser(HTMLLinkParser):
+    """HTMLLinkParser which ignores the first skip anchors."""
+
+    def __init__(self, url):
+        super().__init__(url)
+        self.skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a' and self.skip:
+            self.skip -= 1
+            return
+        super().handle_starttag(tag, attrs)
+
+
+def _is_scannable(page):
+    try:
+        encoding = codecs.lookup(page.encoding or 'utf-8').name
+    except LookupError:
+        return False
+    if encoding not in SCANNABLE_ENCODINGS:
+        return False
+    return UNSCANNABLE_RE.search(page.content) is None
+
+
+def _scan_anchors(content, encoding):
+    """Yields a dict of attributes for each anchor in content, like
+    HTMLLinkParser, then None when an anchor can't be scanned.
+    """
+
+    for start in ANCHOR_START_RE.finditer(content):
+        match = ANCHOR_RE.match(content, start.start())
+        if match is None:
+            yield None
+            return
+        anchor = {}
+        for attribute in ATTRIBUTE_RE.finditer(match.group(1)):
+            name, double, single, unquoted = attribute.groups()
+            value = next((v for v in (double, single, unquoted) if v is not None), None)
+            if value is not None:
+                value = value.decode(encoding)
+                if '&' in value:
+                    value = html.unescape(value)
+            anchor[name.decode(encoding).lower()] = value
+        yield anchor
+
+
+def _chunks(content, chunk_size):
+    for start in range(0, len(content), chunk_size):
+        yield content[start:start + chunk_size]
+
+
+def _parsed_files(parser):
+    anchors, parser.anchors = parser.anchors, []
+    base_url = parser.base_url or parser.url
+    for anchor in anchors:
+        yield IndexFile.from_element(anchor, base_url)
+
+
+def _wheel_tags(filename):
+    parts = filename[:-4].split('-')
+    if len(parts) not in (5, 6):
+        return None
+    return {
+        (interpreter, abi, platform)
+        for interpreter in parts[-3].lower().split('.')
+        for abi in parts[-2].lower().split('.')
+        for platform in parts[-1].lower().split('.')
+    }
+
+
+def get_upload_times(page):
+    """Returns a dict mapping file name to upload time for each file on a
+    PEP 700 JSON project page, or an empty dict for other pages.
+
+    :param page:  An IndexContent instance.
+    """
+
+    if not page.content_type.lower().startswith('application/vnd.pypi.simple.v1+json'):
+        return {}
+    if b'"upload-time"' not in page.content:
+        return {}
+
+    result = {}
+    for file in json.loads(page.content).get('files', []):
+        filename = file.get('filename')
+        upload_time = file.get('upload-time')
+        if not filename or not upload_time:
+            continue
+        try:
+            dt = datetime.fromisoformat(upload_time.replace('Z', '+00:00'))
+        except ValueError:
+            continue
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        result[filename] = dt
+    return result
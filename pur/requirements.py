@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+    pur.requirements
+    ~~~~~~~~~~~~~~~~
+    Compact records of the requirements read from requirements files.
+    :copyright: (c) 2016 Alan Hamlett.
+    :license: BSD, see LICENSE for more details.
+"""
+
+
+from pip._internal.req.constructors import (_looks_like_path,
+                                            install_req_from_parsed_requirement)
+from pip._internal.utils.filetypes import is_archive_file
+from pip._internal.utils.packaging import get_requirement
+from pip._internal.vcs.versioncontrol import is_url
+from pip._vendor.packaging.requirements import InvalidRequirement
+from pip._vendor.packaging.utils import canonicalize_name
+
+from .utils import current_version, specifier_span, version_spans
+
+
+class PurRequirement(object):
+    """The parts of a requirement line pur reads, used in place of pip's
+    InstallRequirement.
+
+    :param name:         The package name.
+    :param specifier:    SpecifierSet of the requirement.
+    :param extras:       Set of extras.
+    :param markers:      A Marker instance, or None.
+    :param link:         A Link when the requirement is a url or path,
+                         otherwise None.
+    :param is_editable:  True for editable requirements.
+    :param spec_span:    Tuple of (start, end) columns of the version
+                         specifier in the requirement line, or None.
+    :param version_spans:  Tuple of (operator, version, start, end) for each
+                           clause of the version specifier, where start and
+                           end are the columns of the version.
+    """
+
+    __slots__ = ('name', 'canonical_name', 'specifier', 'spec_ver', 'extras',
+                 'markers', 'link', 'is_editable', 'spec_span',
+                 'version_spans')
+
+    def __init__(self, name, specifier, extras=(), markers=None, link=None,
+                 is_editable=False, spec_span=None, version_spans=()):
+        self.name = name
+        self.canonical_name = canonicalize_name(name)
+        self.specifier = specifier
+        self.spec_ver = current_version(self)
+        self.extras = extras
+        self.markers = markers
+        self.link = link
+        self.is_editable = is_editable
+        self.spec_span = spec_span
+        self.version_spans = version_spans
+
+    def __repr__(self):
+        return '<PurRequirement {0}{1}>'.format(self.name, self.specifier)
+
+
+def parse_requirement(parsed_req, cache=None):
+    """Returns a PurRequirement for a requirement line, or None when the
+    requirement has no name.
+
+    Requirement specifiers like name==1.0 are parsed directly, only urls,
+    paths and editable requirements are built into an InstallRequirement.
+
+    :param parsed_req:  A ParsedRequirement instance.
+    :param cache:       Optional dict of requirements already parsed, keyed
+                        on the requirement text, so a line repeated across
+                        requirements files is parsed once.
+    """
+
+    if cache is None:
+        return _parse_requirement(parsed_req)
+    key = (parsed_req.requirement.rstrip(), parsed_req.is_editable)
+    try:
+        return cache[key]
+    except KeyError:
+        req = cache[key] = _parse_requirement(parsed_req)
+        return req
+
+
+def _parse_requirement(parsed_req):
+    text = parsed_req.requirement
+    if not parsed_req.is_editable and _is_specifier(text):
+        try:
+            req = get_requirement(text.strip())
+        except InvalidRequirement:
+            req = None
+        if (
+            req is not None and req.url is None and req.specifier and
+            not any(str(spec).endswith(']') for spec in req.specifier)
+        ):
+            return _requirement(req.name, req.specifier, text,
+                                extras=req.extras, markers=req.marker)
+
+    # let pip handle everything else, and raise its errors
+    install_req = install_req_from_parsed_requirement(
+        parsed_req,
+        user_supplied=True,
+    )
+    if install_req.name is None:
+        return None
+    return _requirement(
+        install_req.name,
+        install_req.specifier,
+        None if install_req.link else text,
+        extras=install_req.extras,
+        markers=install_req.markers,
+        link=install_req.link,
+        is_editable=install_req.editable,
+    )
+
+
+def _requirement(name, specifier, text, **kwargs):
+    spec_span = specifier_span(text) if text is not None else None
+    if spec_span is not None:
+        kwargs.update(spec_span=spec_span,
+                      version_spans=version_spans(text, spec_span[0]))
+    return PurRequirement(name, specifier, **kwargs)
+
+
+def _is_specifier(text):
+    # same checks pip's parse_req_from_line makes before treating the text
+    # as a requirement specifier instead of a url or path
+    if is_url(text):
+        return False
+    name = text.split(';', 1)[0].strip()
+    return not _looks_like_path(name) and not is_archive_file(name)
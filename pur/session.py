@@ -0,0 +1,441 @@
+# -*- coding: utf-8 -*-
+"""
+    pur.session
+    ~~~~~~~~~~~
+    HTTP session used when looking up packages on package indexes.
+    :copyright: (c) 2016 Alan Hamlett.
+    :license: BSD, see LICENSE for more details.
+"""
+
+
+import calendar
+import contextlib
+import logging
+import os
+import posixpath
+import re
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_tz
+
+from pip._internal.network.session import PipSession
+from pip._vendor.cachecontrol import CacheControlAdapter
+from pip._vendor.cachecontrol.controller import CacheController, parse_uri
+from pip._vendor import requests
+from pip._vendor.requests.adapters import HTTPAdapter
+from pip._vendor.platformdirs import user_cache_dir
+from pip._vendor.requests.structures import CaseInsensitiveDict
+from pip._vendor.urllib3 import Retry
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORTS = {'http': '80', 'https': '443'}
+# how long index pages older than --index-ttl are served from the cache while
+# being refreshed in the background
+MAX_STALE_SECONDS = 86400
+REFRESH_WORKERS = 4
+PRECONNECT_TIMEOUT = 10
+# pip retries these, and 429 Too Many Requests is retried after backing off
+RETRY_STATUSES = [429, 500, 503, 520, 527]
+RETRY_BACKOFF_FACTOR = 0.25
+# same as urllib3's Retry.DEFAULT_BACKOFF_MAX
+DEFAULT_MAX_BACKOFF = 120
+DEFAULT_MAX_HOST_FAILURES = 3
+JSON_API_CONTENT_TYPE = 'application/vnd.pypi.simple.v1+json'
+
+
+def default_cache_dir():
+    """Returns the user's cache directory for pur."""
+
+    return user_cache_dir('pur', appauthor=False)
+
+
+def host_of(url):
+    """Returns the host of url, with the port when given.
+
+    :param url:  An absolute url.
+    """
+
+    return urllib.parse.urlsplit(url).netloc.rpartition('@')[2].lower()
+
+
+class PurCacheController(CacheController):
+    """CacheController which normalizes urls before using them as cache keys,
+    so different spellings of the same index url share cache entries.
+
+    When ttl is set, index pages are trusted from the cache for ttl seconds
+    instead of always being revalidated. Pages older than that are still
+    served from the cache, and on_stale is called with the request so the
+    page can be refreshed in the background.
+    """
+
+    def __init__(self, cache=None, ttl=0, max_stale=MAX_STALE_SECONDS,
+                 on_stale=None, **kwargs):
+        super().__init__(cache, **kwargs)
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.on_stale = on_stale
+
+    def cached_request(self, request):
+        # pip requests index pages with max-age=0, which would always bypass
+        # the cache and revalidate the page
+        if not self.ttl or request.headers.get('Cache-Control') != 'max-age=0':
+            return super().cached_request(request)
+
+        window = request.copy()
+        window.headers['Cache-Control'] = 'max-age={0}'.format(self.ttl + self.max_stale)
+        response = super().cached_request(window)
+        if response and self.on_stale and _age(response) > self.ttl:
+            self.on_stale(request)
+        return response
+
+    @classmethod
+    def cache_url(cls, uri):
+        scheme, authority, path, query, _ = parse_uri(uri)
+        if not scheme or not authority:
+            return super().cache_url(uri)
+
+        scheme = scheme.lower()
+        userinfo, _, host = authority.rpartition('@')
+        host = host.lower()
+        default_port = DEFAULT_PORTS.get(scheme)
+        if default_port and host.endswith(':' + default_port):
+            host = host[:-len(default_port) - 1]
+        if userinfo:
+            host = userinfo + '@' + host
+
+        trailing_slash = path.endswith('/')
+        path = posixpath.normpath(re.sub(r'/+', '/', path or '/'))
+        if trailing_slash and not path.endswith('/'):
+            path += '/'
+
+        url = scheme + '://' + host + path
+        if query:
+            url += '?' + query
+        return url
+
+
+class PurRetry(Retry):
+    """Retry which never sleeps longer than max_backoff seconds between
+    attempts, including when a server sends a longer Retry-After header.
+    """
+
+    def __init__(self, *args, max_backoff=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_backoff = max_backoff
+
+    def new(self, **kwargs):
+        kwargs.setdefault('max_backoff', self.max_backoff)
+        return super().new(**kwargs)
+
+    def get_backoff_time(self):
+        return self._cap(super().get_backoff_time())
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return self._cap(retry_after)
+
+    def _cap(self, seconds):
+        if self.max_backoff is None:
+            return seconds
+        return min(seconds, self.max_backoff)
+
+
+class HostUnavailable(requests.ConnectionError):
+    """Raised instead of sending a request to a host which failed too many
+    times in a row.
+    """
+
+
+class HostStats(object):
+    """Requests made to one host and how long they took."""
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.seconds = 0.0
+
+    @property
+    def average_seconds(self):
+        if not self.requests:
+            return 0.0
+        return self.seconds / self.requests
+
+
+class RequestStats(object):
+    """Retries and unreachable hosts seen while looking up one package."""
+
+    def __init__(self):
+        self.retries = 0
+        self.unreachable_hosts = set()
+
+    def update(self, other):
+        self.retries += other.retries
+        self.unreachable_hosts.update(other.unreachable_hosts)
+
+
+class PurSession(PipSession):
+    """PipSession using pur's cache directory layout and cache keys.
+
+    :param index_ttl:      Seconds to trust cached index pages without
+                           revalidating them. Stale pages are refreshed in the
+                           background, and close() waits for those refreshes.
+    :param pool_maxsize:   Number of connections kept open to each host,
+                           which should be at least the number of concurrent
+                           requests so connections aren't thrown away.
+    :param retries:        Number of times to retry a failed request.
+    :param timeout:        Seconds to wait for the server before giving up.
+    :param max_backoff:    Most seconds to wait between retries, including
+                           waits requested by a Retry-After header.
+    :param max_host_failures:  Stop sending requests to a host for the rest
+                           of the session after this many requests to it
+                           failed in a row, or 0 to never stop.
+    """
+
+    def __init__(self, *args, cache=None, index_ttl=0, pool_maxsize=None,
+                 retries=0, timeout=None, max_backoff=DEFAULT_MAX_BACKOFF,
+                 max_host_failures=0, **kwargs):
+        if cache:
+            cache = os.path.join(cache, 'http')
+        super().__init__(*args, cache=cache, retries=retries, **kwargs)
+        self.timeout = timeout
+        self.retries = retries
+        self.max_backoff = max_backoff
+        self.max_host_failures = max_host_failures
+        self.host_stats = {}
+
+        self._request_stats = threading.local()
+        self.hooks['response'].append(self._count_retries)
+
+        max_retries = PurRetry(
+            total=retries,
+            status_forcelist=RETRY_STATUSES,
+            backoff_factor=RETRY_BACKOFF_FACTOR,
+            max_backoff=max_backoff,
+        )
+        for adapter in self._http_adapters():
+            adapter.max_retries = max_retries
+
+        if pool_maxsize:
+            for adapter in self._http_adapters():
+                adapter._pool_maxsize = pool_maxsize
+                adapter.init_poolmanager(
+                    adapter._pool_connections,
+                    pool_maxsize,
+                    block=adapter._pool_block,
+                )
+
+        self._refresh_executor = None
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._preconnected = set()
+
+        for adapter in self._http_adapters():
+            if isinstance(adapter, CacheControlAdapter):
+                adapter.controller = PurCacheController(
+                    adapter.cache,
+                    ttl=index_ttl,
+                    on_stale=self._refresh_in_background,
+                    serializer=adapter.controller.serializer,
+                )
+
+    def is_cached(self, url):
+        """Returns True if an index page request for url would be answered
+        from the cache without waiting on the network.
+
+        :param url:  The index page url.
+        """
+
+        adapter = self.get_adapter(url)
+        if not isinstance(adapter, CacheControlAdapter) or not adapter.controller.ttl:
+            return False
+        request = self.prepare_request(requests.Request(
+            'GET', url, headers={'Cache-Control': 'max-age=0'},
+        ))
+        return bool(adapter.controller.cached_request(request))
+
+    def request(self, method, url, *args, **kwargs):
+        host = host_of(url)
+        if self.is_host_down(host):
+            self.add_request_stats(unreachable_host=host)
+            raise HostUnavailable('Skipped {0} after {1} failed requests in a row'.format(
+                host, self.host_stats[host].consecutive_failures,
+            ))
+
+        start = time.monotonic()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except requests.RequestException:
+            self.record_request(host, time.monotonic() - start, failed=True)
+            raise
+        self.record_request(host, time.monotonic() - start,
+                            failed=response.status_code in RETRY_STATUSES)
+        return response
+
+    def record_request(self, host, seconds, failed=False):
+        """Adds a request to the stats for host.
+
+        :param host:     The host name, with port when not the default.
+        :param seconds:  How long the request took.
+        :param failed:   True when the request failed or the server
+                         answered with a retryable error.
+        """
+
+        with self._lock:
+            stats = self.host_stats.get(host)
+            if stats is None:
+                stats = self.host_stats[host] = HostStats()
+            stats.requests += 1
+            stats.seconds += seconds
+            if failed:
+                stats.failures += 1
+                stats.consecutive_failures += 1
+            else:
+                stats.consecutive_failures = 0
+        if failed:
+            self.add_request_stats(unreachable_host=host)
+
+    def is_host_down(self, host):
+        """Returns True when requests to host failed max_host_failures
+        times in a row.
+
+        :param host:  The host name, with port when not the default.
+        """
+
+        stats = self.host_stats.get(host)
+        return bool(self.max_host_failures and stats is not None and
+                    stats.consecutive_failures >= self.max_host_failures)
+
+    @contextlib.contextmanager
+    def track_requests(self):
+        """Tracks retries and unreachable hosts for requests made by the
+        current thread inside the with block. Yields a RequestStats.
+        """
+
+        stack = getattr(self._request_stats, 'stack', None)
+        if stack is None:
+            stack = self._request_stats.stack = []
+        stats = RequestStats()
+        stack.append(stats)
+        try:
+            yield stats
+        finally:
+            stack.remove(stats)
+
+    def add_request_stats(self, stats=None, retries=0, unreachable_host=None):
+        """Adds requests made outside this session or thread, for example by
+        pur.async_index.AsyncIndexClient, to the current thread's stats.
+
+        :param stats:             A RequestStats to add.
+        :param retries:           Number of retried requests.
+        :param unreachable_host:  A host which failed to answer.
+        """
+
+        for tracked in getattr(self._request_stats, 'stack', []):
+            if stats is not None:
+                tracked.update(stats)
+            tracked.retries += retries
+            if unreachable_host is not None:
+                tracked.unreachable_hosts.add(unreachable_host)
+
+    def _count_retries(self, response, **kwargs):
+        retries = getattr(response.raw, 'retries', None)
+        history = getattr(retries, 'history', None)
+        if history:
+            self.add_request_stats(retries=len(history))
+
+    def preconnect(self, urls, connections=1):
+        """Opens connections to the hosts of urls in background threads, so
+        later requests skip the TCP and TLS handshakes. Failures are ignored
+        and left for the real requests to report. Hosts are only connected
+        to once per session.
+
+        :param urls:         List of urls, usually the index urls.
+        :param connections:  Number of connections to open to each host.
+        """
+
+        hosts = {}
+        for url in urls:
+            parts = urllib.parse.urlsplit(url)
+            if parts.scheme in ('http', 'https'):
+                hosts.setdefault((parts.scheme, parts.netloc.lower()), url)
+
+        with self._lock:
+            hosts = {
+                host: url for host, url in hosts.items()
+                if host not in self._preconnected
+            }
+            self._preconnected.update(hosts)
+
+        for url in hosts.values():
+            for _ in range(connections):
+                thread = threading.Thread(target=self._preconnect, args=(url,))
+                thread.daemon = True
+                thread.start()
+
+    def _preconnect(self, url):
+        try:
+            adapter = self.get_adapter(url)
+            if not isinstance(adapter, HTTPAdapter):
+                return
+            settings = self.merge_environment_settings(url, {}, None, None, None)
+            pool = adapter.get_connection(url, settings['proxies'])
+            # verify certificates the same way HTTPAdapter.send will
+            adapter.cert_verify(pool, url, settings['verify'], settings['cert'])
+            conn = pool._get_conn()
+        except Exception as e:
+            logger.debug('Could not connect to %s: %s', url, e)
+            return
+
+        try:
+            conn.timeout = self.timeout or PRECONNECT_TIMEOUT
+            conn.connect()
+        except Exception as e:
+            logger.debug('Could not connect to %s: %s', url, e)
+            conn.close()
+            conn = None
+        pool._put_conn(conn)
+
+    def close(self):
+        if self._refresh_executor is not None:
+            self._refresh_executor.shutdown()
+            self._refresh_executor = None
+        super().close()
+
+    def _http_adapters(self):
+        adapters = set(self.adapters.values()) | {self._trusted_host_adapter}
+        return [a for a in adapters if isinstance(a, HTTPAdapter)]
+
+    def _refresh_in_background(self, request):
+        with self._lock:
+            if request.url in self._refreshing:
+                return
+            self._refreshing.add(request.url)
+            if self._refresh_executor is None:
+                self._refresh_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS)
+
+        # no-cache skips the ttl but still revalidates with etags, updating
+        # the cached page
+        headers = dict(request.headers)
+        headers['Cache-Control'] = 'no-cache'
+        self._refresh_executor.submit(self._refresh, request.url, headers)
+
+    def _refresh(self, url, headers):
+        try:
+            self.get(url, headers=headers)
+        except Exception as e:
+            logger.debug('Could not refresh cached page %s: %s', url, e)
+
+
+def _age(response):
+    headers = CaseInsensitiveDict(response.headers)
+    date = parsedate_tz(headers.get('date', ''))
+    if date is None:
+        return float('inf')
+    return time.time() - calendar.timegm(date)
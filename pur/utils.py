@@ -8,28 +8,51 @@
 """
 
 
+import copy
+import optparse
 import re
 from datetime import datetime, timedelta, timezone
 
 import click
 from click import echo as _echo
-from pip._internal.index.collector import LinkCollector
 from pip._internal.index.package_finder import PackageFinder
 from pip._internal.models.search_scope import SearchScope
 from pip._internal.models.selection_prefs import SelectionPreferences
-from pip._internal.req.req_file import COMMENT_RE
-from pip._vendor.packaging.version import InvalidVersion, Version, parse
+from pip._internal.req.req_file import (COMMENT_RE, break_args_options,
+                                        build_parser, get_line_parser)
+from pip._internal.utils.filetypes import is_archive_file
+from pip._internal.utils.hashes import STRONG_HASHES
+from pip._vendor.packaging.utils import canonicalize_name
+from pip._vendor.packaging.version import Version
 
 from .exceptions import InvalidPackage, StopUpdating
+from .index import PurLinkCollector, PurPackageFinder, file_version
+from .versions import VersionIndex, parse_version
 
 
+# options of a line in a hash-pinned requirements file, when they are only
+# --hash options without quotes or escapes which shlex would remove
+HASH_OPTION_PATTERN = r'--hash(?:=|\s+)[^\s:\'"\\]+:[^\s\'"\\]+'
+HASH_OPTIONS_RE = re.compile(r'\s*{0}(?:\s+{0})*\s*'.format(HASH_OPTION_PATTERN))
+HASH_OPTION_RE = re.compile(r'--hash(?:=|\s+)([^\s:]+):(\S+)')
+
+# the name and extras before the version specifier of a requirement
+NAME_RE = re.compile(r'\s*[A-Za-z0-9][A-Za-z0-9._-]*\s*(?:\[[^\]]*\]\s*)?\(?\s*')
+
+# a clause of a version specifier, like >= 1.0, and the comma after it
+SPECIFIER_CLAUSE_RE = re.compile(r'\s*(===|~=|==|!=|<=|>=|<|>)\s*([^\s,;)\\]+)(\s*,)?')
+
+# the project name a requirement line starts with, unless the line is an
+# option, url or path
+REQUIREMENT_NAME_RE = re.compile(r'\s*([A-Za-z0-9][A-Za-z0-9._-]*)(?=[\s\[<>=!~;(@]|$)')
+
 def build_package_finder(session=None, index_urls=[]):
     search_scope = SearchScope.create(
         find_links=[],
         index_urls=index_urls,
         no_index=False,
     )
-    link_collector = LinkCollector(
+    link_collector = PurLinkCollector(
         session=session,
         search_scope=search_scope,
     )
@@ -38,12 +61,191 @@ def build_package_finder(session=None, index_urls=[]):
         allow_all_prereleases=True,
         # ignore_requires_python=True,
     )
-    return PackageFinder.create(
+    return PurPackageFinder.create(
         link_collector=link_collector,
         selection_prefs=selection_prefs,
     )
 
 
+def save_finder_options(finder):
+    """Returns the finder options which option lines in a requirements file
+    can change, to be put back later with restore_finder_options.
+
+    :param finder:  Instance of pip.download.PackageFinder.
+    """
+
+    return finder.search_scope, copy.copy(finder._candidate_prefs)
+
+
+def restore_finder_options(finder, options, session=None):
+    """Puts back finder options saved with save_finder_options.
+
+    :param finder:   Instance of pip.download.PackageFinder.
+    :param options:  Return value of save_finder_options.
+    :param session:  The PipSession, so its auth follows the index urls.
+    """
+
+    search_scope, candidate_prefs = options
+    changed = index_options(finder) != _index_options(search_scope)
+    finder.search_scope = search_scope
+    finder._candidate_prefs = candidate_prefs
+    if changed:
+        if session is not None:
+            session.update_index_urls(list(search_scope.index_urls))
+        forget_found_candidates(finder)
+
+
+def index_options(finder):
+    """Returns a tuple of the index options used to find candidates.
+
+    :param finder:  Instance of pip.download.PackageFinder.
+    """
+
+    return _index_options(finder.search_scope)
+
+
+def forget_found_candidates(finder):
+    """Clears candidates found by the finder, after the indexes it searches
+    changed, so they are found again from the new indexes.
+
+    :param finder:  Instance of pip.download.PackageFinder.
+    """
+
+    # the cache is keyed on project name, not on the indexes searched
+    PackageFinder.find_all_candidates.cache_clear()
+    reset = getattr(finder._link_collector, 'reset', None)
+    if reset is not None:
+        reset()
+
+
+def _index_options(search_scope):
+    return (
+        tuple(search_scope.index_urls),
+        tuple(search_scope.find_links),
+        search_scope.no_index,
+    )
+
+
+def build_line_parser(finder):
+    """Returns a function parsing a requirements file line into a tuple of
+    (args string, options), same as pip's get_line_parser.
+
+    pip builds a new optparse parser for every line, so lines without
+    options and lines with only --hash options are parsed directly. Other
+    lines are still parsed by pip.
+
+    :param finder:  Instance of pip.download.PackageFinder.
+    """
+
+    parse_options = get_line_parser(finder)
+    defaults = build_parser().get_default_values()
+    defaults.index_url = None
+
+    def parse_line(line):
+        if not line.startswith('-') and ' -' not in line:
+            return line, _line_options(defaults, finder)
+
+        args_str, options_str = break_args_options(line)
+        hashes = _parse_hash_options(options_str)
+        if hashes is None:
+            return parse_options(line)
+        options = _line_options(defaults, finder)
+        options.hashes = hashes
+        return args_str, options
+
+    return parse_line
+
+
+def _line_options(defaults, finder):
+    options = optparse.Values(defaults.__dict__)
+    if finder:
+        options.format_control = finder.format_control
+    return options
+
+
+def _parse_hash_options(options_str):
+    if not HASH_OPTIONS_RE.fullmatch(options_str):
+        return None
+    hashes = {}
+    for algo, digest in HASH_OPTION_RE.findall(options_str):
+        if algo not in STRONG_HASHES:
+            # let pip report the error
+            return None
+        hashes.setdefault(algo, []).append(digest)
+    return hashes
+
+
+def requirement_name(line):
+    """Returns the lowercased project name a requirement line starts with,
+    without parsing the line, or None when the line doesn't start with a
+    project name.
+
+    :param line:  A requirements file line without comments.
+    """
+
+    match = REQUIREMENT_NAME_RE.match(line)
+    if match is None or is_archive_file(match.group(1)):
+        return None
+    return match.group(1).lower()
+
+
+def specifier_span(text):
+    """Returns a tuple of (start, end) columns of the version specifier in a
+    requirement specifier like name[extras]>=1.0,<2 ; markers, or None when
+    it has no version specifier.
+
+    :param text:  A requirement specifier string.
+    """
+
+    match = NAME_RE.match(text)
+    if match is None:
+        return None
+    start = match.end()
+    end = text.find(';', start)
+    if end < 0:
+        end = len(text)
+    spec = text[start:end].rstrip()
+    if spec.endswith(')'):
+        spec = spec[:-1].rstrip()
+    if not spec or spec[0] not in '<>=!~':
+        return None
+    return start, start + len(spec)
+
+
+def version_spans(text, start):
+    """Returns a tuple of (operator, version, start, end) for each clause of
+    the version specifier at column start of text, where start and end are
+    the columns of the clause's version.
+
+    :param text:   A requirement line.
+    :param start:  Column where the version specifier starts.
+    """
+
+    spans = []
+    pos = start
+    while True:
+        match = SPECIFIER_CLAUSE_RE.match(text, pos)
+        if match is None:
+            break
+        spans.append((match.group(1), match.group(2), match.start(2), match.end(2)))
+        if match.group(3) is None:
+            break
+        pos = match.end()
+    return tuple(spans)
+
+
+def is_excluded(name, skip, only):
+    """Returns True when a package is excluded from updating by --skip or
+    --only.
+
+    :param name:  A lowercased project name.
+    :param skip:  List of packages to skip updating.
+    :param only:  List of packages to update, skipping all others.
+    """
+
+    return name in skip or (len(only) > 0 and name not in only)
+
+
 def join_lines(lines_enum):
     """Joins a line ending in '\' with the previous line (except when following
     comments).  The joined line takes on the index of the first line.
@@ -81,13 +283,13 @@ def join_lines(lines_enum):
 
 
 def current_version(req):
-    """Get the current version from an InstallRequirement instance.
+    """Get the current version from a requirement's version specifier.
 
     Returns a tuple (ver, eq_ver, gt_ver, gte_ver, lt_ver, lte_ver, not_ver).
     The versions in the returned tuple will be either a
     pip.req.req_install.Version instance or None.
 
-    :param req:    Instance of pip.req.req_install.InstallRequirement.
+    :param req:    Instance of pur.requirements.PurRequirement.
     """
 
     eq_ver = None
@@ -96,18 +298,17 @@ def current_version(req):
     lt_ver = None
     lte_ver = None
     not_ver = None
-    for spec in req.req.specifier:
+    for spec in req.specifier:
         operator, version = spec._spec
-        try:
-            ver = Version(version)  # TODO: use parse to support LegacyVersion
-        except InvalidVersion:
+        ver = parse_version(version)
+        if not isinstance(ver, Version):  # TODO: support LegacyVersion
             continue
-        if operator == '==':
+        if operator in ('==', '==='):
             eq_ver = ver
         elif operator == '>':
             if not gt_ver or ver > gt_ver:
                 gt_ver = ver
-        elif operator == '>=':
+        elif operator in ('>=', '~='):
             if not gte_ver or ver > gte_ver:
                 gte_ver = ver
         elif operator == '<':
@@ -167,12 +368,84 @@ def get_package_release_dates(package_name, session):
         return {}
 
 
+def get_candidate_release_dates(project_name, candidates, finder, session):
+    """Returns a dict mapping version string to a timezone-aware datetime of
+    when each version was released.
+
+    Upload times from the project's PEP 700 index page are used when every
+    candidate has one, taking the earliest upload of any file for the
+    version, otherwise falls back to the PyPI JSON API. Results from the
+    JSON API are remembered for the rest of the run.
+
+    :param project_name:  The package name.
+    :param candidates:    List of InstallationCandidate instances.
+    :param finder:        Instance of pip.download.PackageFinder.
+    :param session:       A PipSession instance used for the JSON API.
+    """
+
+    collector = finder._link_collector
+    upload_times = getattr(collector, 'upload_times', {})
+
+    canonical_name = canonicalize_name(project_name)
+    # candidates are found once per version, so look at every file
+    earliest = {}
+    result = {}
+    for candidate in candidates:
+        page_url = getattr(candidate.link.comes_from, 'url', candidate.link.comes_from)
+        if page_url not in earliest:
+            earliest[page_url] = _earliest_upload_times(
+                upload_times.get(page_url, {}), canonical_name)
+        upload_time = earliest[page_url].get(
+            file_version(candidate.link.filename, canonical_name))
+        if upload_time is None:
+            break
+        version = str(candidate.version)
+        if version not in result or upload_time < result[version]:
+            result[version] = upload_time
+    else:
+        return result
+
+    memo = getattr(collector, 'release_dates', None)
+    if memo is None:
+        return get_package_release_dates(project_name, session)
+    if project_name not in memo:
+        memo[project_name] = get_package_release_dates(project_name, session)
+    return memo[project_name]
+
+
+def _earliest_upload_times(upload_times, canonical_name):
+    result = {}
+    for filename, upload_time in upload_times.items():
+        version = file_version(filename, canonical_name)
+        if version is not None and (version not in result or upload_time < result[version]):
+            result[version] = upload_time
+    return result
+
+
+def get_version_index(project_name, candidates, finder):
+    """Returns a VersionIndex of candidates, reusing the finder's index for
+    the project while its candidates haven't been found again.
+
+    :param project_name:  The package name.
+    :param candidates:    List of InstallationCandidate instances.
+    :param finder:        Instance of pip.download.PackageFinder.
+    """
+
+    memo = getattr(finder, 'version_indexes', None)
+    if memo is None:
+        return VersionIndex(candidates)
+    index = memo.get(project_name)
+    if index is None or index.source is not candidates:
+        index = memo[project_name] = VersionIndex(candidates)
+    return index
+
+
 def latest_version(req, spec_ver, finder, minor=[], patch=[], pre=[],
                    cooldown_days=0, session=None):
     """Returns a Version instance with the latest version for the package.
     Raises InvalidPackage error if no candidates available.
 
-    :param req:           Instance of pip.req.req_install.InstallRequirement.
+    :param req:           Instance of pur.requirements.PurRequirement.
     :param spec_ver:      Tuple of current versions from the requirements file.
     :param finder:        Instance of pip.download.PackageFinder.
     :param minor:         List of packages to only update minor and patch
@@ -193,38 +466,44 @@ def latest_version(req, spec_ver, finder, minor=[], patch=[], pre=[],
     if len(all_candidates) == 0:
         raise InvalidPackage()
 
-    if req.name.lower() in patch or '*' in patch:
-        all_candidates = [c for c in all_candidates
-                          if less_than(c.version, spec_ver[0], patch=True)]
-    elif req.name.lower() in minor or '*' in minor:
-        all_candidates = [c for c in all_candidates
-                          if less_than(c.version, spec_ver[0])]
-
-    if req.name.lower() not in pre and '*' not in pre:
-        all_candidates = [candidate for candidate in all_candidates
-                          if not candidate.version.is_prerelease]
-
-    if cooldown_days > 0 and session is not None:
-        cutoff = datetime.now(timezone.utc) - timedelta(days=cooldown_days)
-        release_dates = get_package_release_dates(req.name, session)
-        if release_dates:
-            all_candidates = [
-                c for c in all_candidates
-                if release_dates.get(str(c.version), cutoff) <= cutoff
-            ]
-
-    if not all_candidates:
-        return None
+    name = req.name.lower()
+    only_patch = name in patch or '*' in patch
+    only_minor = not only_patch and (name in minor or '*' in minor)
+    allow_pre = name in pre or '*' in pre
+    check_cooldown = cooldown_days > 0 and session is not None
+    cutoff = datetime.now(timezone.utc) - timedelta(days=cooldown_days)
+
+    index = get_version_index(req.name, all_candidates, finder)
+    stop = None
+    if spec_ver[0] is not None:
+        if only_patch:
+            stop = index.stop_within_minor(spec_ver[0])
+        elif only_minor:
+            stop = index.stop_within_major(spec_ver[0])
 
     candidate_evaluator = finder.make_candidate_evaluator(
         project_name=req.name,
     )
-    applicable_candidates = candidate_evaluator.get_applicable_candidates(all_candidates)
-    best_candidate = candidate_evaluator.sort_best_candidate(applicable_candidates)
-    if not best_candidate:
-        return None
 
-    return best_candidate.version
+    # yanked files and files for other Pythons are never candidates, so the
+    # newest version passing every filter is the best candidate
+    for version in index.newest_first(stop):
+        if not allow_pre and version.is_prerelease:
+            continue
+
+        candidates = index.candidates[version]
+        if check_cooldown:
+            release_dates = get_candidate_release_dates(
+                req.name, candidates, finder, session)
+            if release_dates.get(str(version), cutoff) > cutoff:
+                continue
+
+        applicable_candidates = candidate_evaluator.get_applicable_candidates(candidates)
+        best_candidate = candidate_evaluator.sort_best_candidate(applicable_candidates)
+        if best_candidate:
+            return best_candidate.version
+
+    return None
 
 
 def can_check_version(req, spec_ver, skip, skip_gt, only):
@@ -234,16 +513,13 @@ def can_check_version(req, spec_ver, skip, skip_gt, only):
     if skip_gt and (spec_ver[2] or spec_ver[3]):
         return False
 
-    if req.name.lower() in skip:
-        return False
-
-    return len(only) == 0 or req.name.lower() in only
+    return not is_excluded(req.name.lower(), skip, only)
 
 
 def should_update(req, spec_ver, latest_ver, force=False, interactive=False):
     """Returns True if this requirement should be updated, False otherwise.
 
-    :param req:          Instance of pip.req.req_install.InstallRequirement.
+    :param req:          Instance of pur.requirements.PurRequirement.
     :param spec_ver:     Tuple of current versions from the requirements file.
     :param latest_ver:   Latest version from pypi.
     :param force:        Force getting latest version even for packages without
@@ -283,6 +559,9 @@ def should_update(req, spec_ver, latest_ver, force=False, interactive=False):
     if lte_ver is not None and not latest_ver <= lte_ver:
         return False
 
+    if gte_ver is not None and _compatible_release_allows(req, gte_ver, latest_ver):
+        return False
+
     return not interactive or ask_to_update(req, spec_ver, latest_ver)
 
 
@@ -292,7 +571,7 @@ def ask_to_update(req, spec_ver, latest_ver):
     Returns True if should update, False if should skip, and raises
     SaveAndStopUpdating or StopUpdating exceptions if the user selected quit.
 
-    :param req:         Instance of pip.req.req_install.InstallRequirement.
+    :param req:         Instance of pur.requirements.PurRequirement.
     :param spec_ver:    Tuple of current versions from the requirements file.
     :param latest_ver:  Latest version from pypi.
     """
@@ -328,58 +607,69 @@ def ask_to_update(req, spec_ver, latest_ver):
 def update_requirement_line(req, line, spec_ver, latest_ver):
     """Updates the version of a requirement line.
 
-    Returns a new requirement line with the package version updated.
+    Returns a new requirement line with the package version updated in
+    each == or === clause pinning the old version, or else in each >= or ~=
+    clause with the old version.
 
-    :param req:         Instance of pip.req.req_install.InstallRequirement.
+    :param req:         Instance of pur.requirements.PurRequirement.
     :param line:        The requirement line string.
     :param spec_ver:    Tuple of current versions from the requirements file.
     :param latest_ver:  Latest version from pypi.
     """
 
-    start_of_spec = (line.index(']') + 1 if ']' in line.split('#')[0]
-                     else len(req.name))
-    package_part = line[:start_of_spec]
-    spec_part = line[start_of_spec:]
-
-    old_ver = spec_ver[1] or spec_ver[3]
-    spec_regex = re.sub(r'(\W)', r'\\\1', str(old_ver))
-    pattern = r'((==|>=)\s*){0}'.format(spec_regex)
-    match = re.search(pattern, spec_part)
-    if match is None:
+    spans = req.version_spans
+    if not spans or any(line[start:end] != version for _, version, start, end in spans):
+        # the line was joined from several lines, so find the clauses again
+        match = SPECIFIER_CLAUSE_RE.search(line)
+        spans = version_spans(line, match.start()) if match else ()
+
+    if spec_ver[1] is not None:
+        old_ver, operators = spec_ver[1], ('==', '===')
+    else:
+        old_ver, operators = spec_ver[3], ('>=', '~=')
+
+    parts = []
+    pos = 0
+    for operator, version, start, end in spans:
+        if operator not in operators or parse_version(version) != old_ver:
+            continue
+        if operator == '~=':
+            new_ver = _compatible_version(version, latest_ver)
+        else:
+            new_ver = str(latest_ver)
+        parts.append(line[pos:start])
+        parts.append(new_ver)
+        pos = end
+    if not parts:
         return line
-    pre_part = match.group(1)
-    old = '{0}{1}'.format(pre_part, str(old_ver))
-    new = '{0}{1}'.format(pre_part, str(latest_ver))
-    new_line = '{package_part}{spec_part}'.format(
-        package_part=package_part,
-        spec_part=spec_part.replace(old, new, 1),
-    )
-    return new_line
+    parts.append(line[pos:])
+    return ''.join(parts)
 
 
-def requirements_line(line, req):
-    return not req and line and line.strip().startswith('-r ')
+def _compatible_release_allows(req, gte_ver, latest_ver):
+    # a ~= clause for the current version already allows later releases in
+    # its range, so there is nothing to update
+    for spec in req.specifier:
+        operator, version = spec._spec
+        if (operator == '~=' and parse_version(version) == gte_ver and
+                spec.contains(latest_ver, prereleases=True)):
+            return True
+    return False
 
 
-def less_than(new_ver, old_ver, patch=False):
-    if old_ver is None:
-        return True
-    new_ver = str(new_ver).split('.')
-    old_ver = str(old_ver).split('.')
-    if old_ver[0] is None:
-        return True
-    new_major = parse(new_ver[0] or 0)
-    old_major = parse(old_ver[0] or 0)
-    if new_major > old_major:
-        return False
-    if patch:
-        if len(old_ver) == 1 or old_ver[1] is None:
-            return True
-        new_minor = parse('1.0.{}'.format((new_ver[1] if len(new_ver) > 1 else 0) or 0))
-        old_minor = parse('1.0.{}'.format((old_ver[1] if len(old_ver) > 1 else 0) or 0))
-        if new_minor > old_minor:
-            return False
-    return True
+def _compatible_version(version, latest_ver):
+    # keep as many release numbers as the old version, so ~=1.4 becomes
+    # ~=2.3 instead of also pinning the patch release
+    if (latest_ver.epoch or latest_ver.pre or latest_ver.local or
+            latest_ver.post is not None or latest_ver.dev is not None):
+        return str(latest_ver)
+    size = len(parse_version(version).release)
+    release = (latest_ver.release + (0,) * size)[:size]
+    return '.'.join(str(number) for number in release)
+
+
+def requirements_line(line, req):
+    return not req and line and line.strip().startswith('-r ')
 
 
 def format_list_arg(options, key):
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+    pur.versions
+    ~~~~~~~~~~~~
+    Find the latest versions of a package within release limits.
+    :copyright: (c) 2016 Alan Hamlett.
+    :license: BSD, see LICENSE for more details.
+"""
+
+
+from bisect import bisect_right
+from collections import defaultdict
+
+from pip._vendor.packaging.version import parse
+
+
+# parsed versions, shared by every package looked up in the process
+_versions = {}
+
+
+def parse_version(version):
+    """Returns a Version, or a LegacyVersion when version isn't a valid PEP
+    440 version, parsing each distinct version string once per process.
+
+    :param version:  A version string.
+    """
+
+    parsed = _versions.get(version)
+    if parsed is None:
+        parsed = _versions[version] = parse(version)
+    return parsed
+
+
+class VersionIndex(object):
+    """The distinct versions of a package's candidates sorted oldest first,
+    with their major and minor release numbers, so the latest version
+    within a major or minor release is found with a binary search.
+
+    :param candidates:  List of InstallationCandidate instances.
+    """
+
+    def __init__(self, candidates):
+        self.source = candidates
+        self.candidates = defaultdict(list)
+        for candidate in candidates:
+            self.candidates[candidate.version].append(candidate)
+        # index pages list versions oldest first, which sorts in linear time
+        self.versions = sorted(self.candidates)
+        self._majors = [_major(version) for version in self.versions]
+        self._minors = [_minor(version) for version in self.versions]
+
+    def newest_first(self, stop=None):
+        """Yields versions newest first, starting below the index stop.
+
+        :param stop:  Index into versions to start below, defaults to all
+                      versions.
+        """
+
+        if stop is None:
+            stop = len(self.versions)
+        for i in range(stop - 1, -1, -1):
+            yield self.versions[i]
+
+    def stop_within_major(self, version):
+        """Returns the index into versions just past the latest version with
+        the same or an older major release than version.
+
+        :param version:  A Version instance.
+        """
+
+        return bisect_right(self._majors, _major(version))
+
+    def stop_within_minor(self, version):
+        """Returns the index into versions just past the latest version with
+        the same or an older minor release than version. When version only
+        has a major release number, only the major release is limited.
+
+        :param version:  A Version instance.
+        """
+
+        if len(version.release) < 2:
+            return self.stop_within_major(version)
+        return bisect_right(self._minors, _minor(version))
+
+
+def _major(version):
+    release = version.release
+    if release is None:
+        # LegacyVersions have no release and sort before every Version
+        return -1, -1
+    return version.epoch, release[0]
+
+
+def _minor(version):
+    release = version.release
+    if release is None:
+        return -1, -1, -1
+    return version.epoch, release[0], release[1] if len(release) > 1 else 0
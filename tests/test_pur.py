@@ -1,17 +1,42 @@
 # -*- coding: utf-8 -*-
 
 
+import gzip
+import json
 import os
 import shutil
 import tempfile
-from unittest.mock import patch
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler
+from unittest.mock import Mock, patch
 
 from pur import pur, update_requirements, __version__
+from pur.async_index import AsyncIndexClient
+from pur.index import (PurCandidate, PurCandidateEvaluator, iter_links,
+                       supports_requires_python)
+from pur import requirements as pur_requirements
+from pur.requirements import PurRequirement, parse_requirement
+from pur.session import PurCacheController, PurRetry, PurSession
+from pur.utils import (build_line_parser, build_package_finder, latest_version,
+                       update_requirement_line)
+from pur.versions import VersionIndex, parse_version
 
 from click.testing import CliRunner
+from pip._internal.index.collector import IndexContent, parse_links
 from pip._internal.models.candidate import InstallationCandidate
 from pip._internal.models.link import Link
 from pip._internal.req.req_install import Version
+from pip._internal.req import req_file
+from pip._internal.req.req_file import (OptionParsingError, ParsedRequirement,
+                                        get_line_parser)
+from pip._internal.utils.packaging import check_requires_python
+from pip._vendor import requests
+from pip._vendor.packaging.specifiers import SpecifierSet
+from pip._vendor.packaging.version import parse
 
 from . import utils
 from .utils import u
@@ -23,6 +48,11 @@ class PurTestCase(utils.TestCase):
         self.runner = CliRunner()
         self.maxDiff = None
 
+        # don't open real connections to package indexes
+        patcher = patch('pur.session.PurSession.preconnect')
+        self.mock_preconnect = patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_help_contents(self):
         args = ['--help']
         result = self.runner.invoke(pur, args)
@@ -86,6 +116,68 @@ class PurTestCase(utils.TestCase):
             expected_requirements = open('tests/samples/results/test_updates_package_in_nested_requirements_nested').read()
             self.assertEqual(open(requirements_nested).read(), expected_requirements)
 
+    def test_repeated_requirement_lines_are_parsed_once(self):
+        tempdir = tempfile.mkdtemp()
+        requirements = os.path.join(tempdir, 'requirements.txt')
+        requirements_nested = os.path.join(tempdir, 'requirements-nested.txt')
+        with open(requirements, 'w') as f:
+            f.write('flask==0.9\n-r requirements-nested.txt\nflask==0.9\n')
+        with open(requirements_nested, 'w') as f:
+            f.write('flask==0.9  \nflask>=0.9\n')
+
+        with patch('pip._internal.index.package_finder.PackageFinder.find_all_candidates') as mock_find_all_candidates, \
+                patch('pur.requirements._parse_requirement',
+                      wraps=pur_requirements._parse_requirement) as mock_parse_requirement:
+            mock_find_all_candidates.return_value = [InstallationCandidate('flask', '0.10.1', Link(''))]
+            result = self.runner.invoke(pur, ['-r', requirements])
+
+        self.assertIsNone(result.exception)
+        self.assertEqual(mock_parse_requirement.call_count, 2)
+        self.assertEqual(open(requirements).read(), 'flask==0.10.1\n-r requirements-nested.txt\nflask==0.10.1\n')
+        self.assertEqual(open(requirements_nested).read(), 'flask==0.10.1  \nflask>=0.10.1\n')
+
+    def test_excluded_lines_are_copied_without_parsing(self):
+        tempdir = tempfile.mkdtemp()
+        requirements = os.path.join(tempdir, 'requirements.txt')
+        lines = (
+            'Flask==0.9\n'
+            'django = 1.0  # not a valid requirement\n'
+            'requests[socks]==2.0 \\\n'
+            '    --hash=sha256:abc\n'
+            'readtime>=0.9\n'
+        )
+        with open(requirements, 'w') as f:
+            f.write(lines)
+
+        with patch('pip._internal.index.package_finder.PackageFinder.find_all_candidates') as mock_find_all_candidates, \
+                patch('pur.requirements._parse_requirement',
+                      wraps=pur_requirements._parse_requirement) as mock_parse_requirement:
+            mock_find_all_candidates.return_value = [InstallationCandidate('flask', '0.10.1', Link(''))]
+            result = self.runner.invoke(pur, ['-r', requirements, '--only', 'flask,readtime',
+                                              '--skip', 'readtime'])
+
+        self.assertIsNone(result.exception)
+        self.assertEqual(mock_parse_requirement.call_count, 1)
+        self.assertEqual(open(requirements).read(), lines.replace('Flask==0.9', 'Flask==0.10.1'))
+
+    def test_compatible_release_already_allowing_latest_is_up_to_date(self):
+        tempdir = tempfile.mkdtemp()
+        requirements = os.path.join(tempdir, 'requirements.txt')
+        with open(requirements, 'w') as f:
+            f.write('flask~=1.4\nreadtime~=1.4\n')
+
+        def find_all_candidates(self, project_name):
+            version = '1.4.5' if project_name == 'flask' else '2.1.0'
+            return [InstallationCandidate(project_name, version, Link(''))]
+
+        with patch('pip._internal.index.package_finder.PackageFinder.find_all_candidates',
+                   new=find_all_candidates):
+            updates = update_requirements(input_file=requirements)
+
+        self.assertNotIn('flask', updates)
+        self.assertEqual(updates['readtime'][0]['updated'], True)
+        self.assertEqual(open(requirements).read(), 'flask~=1.4\nreadtime~=2.1\n')
+
     def test_requirements_long_option_accepted(self):
         tempdir = tempfile.mkdtemp()
         requirements = os.path.join(tempdir, 'requirements.txt')
@@ -1020,7 +1112,9 @@ class PurTestCase(utils.TestCase):
 
         with patch('pip._vendor.requests.adapters.HTTPAdapter.send') as mock_send:
             self.runner.invoke(pur, args)
-            self.assertEqual(mock_send.call_args_list[0][0][0].url, 'http://pypi.example.com/flask/')
+            # both indexes are fetched at once, so either may be first
+            urls = sorted(call[0][0].url for call in mock_send.call_args_list)
+            self.assertEqual(urls, ['http://pypi.example.com/flask/', 'https://pypi2.example.com/flask/'])
 
     def test_updates_from_alt_index_url_command_line_arg(self):
         requirements = 'tests/samples/requirements.txt'
@@ -1166,6 +1260,7 @@ class PurTestCase(utils.TestCase):
             'latest': Version('0.10.1'),
             'message': 'Updated flask: 0.9 -> 0.10.1',
             'package': 'flask',
+            'retries': 0,
         }
 
         with patch('pip._internal.index.package_finder.PackageFinder.find_all_candidates') as mock_find_all_candidates:
@@ -1195,6 +1290,7 @@ class PurTestCase(utils.TestCase):
             'latest': Version('0.10.1'),
             'message': 'Updated readtime: 0.9 -> 0.10.1',
             'package': 'readtime',
+            'retries': 0,
         }
         expected_requirements = open('tests/samples/results/test_updates_package_in_nested_requirements').read()
         expected_requirements_nested = open('tests/samples/results/test_updates_package_in_nested_requirements_nested').read()
@@ -1210,3 +1306,1178 @@ class PurTestCase(utils.TestCase):
             self.assertEqual(open(requirements).read(), expected_requirements)
             self.assertEqual(open(requirements_nested).read(), expected_requirements_nested)
             self.assertEqual(result['readtime'][0], expected_result)
+
+    def test_jobs(self):
+        tempdir = tempfile.mkdtemp()
+        requirements = os.path.join(tempdir, 'requirements.txt')
+        shutil.copy('tests/samples/requirements-multiple.txt', requirements)
+        args = ['-r', requirements, '--jobs', '3']
+
+        with patch('pip._internal.index.package_finder.PackageFinder.find_all_candidates') as mock_find_all_candidates:
+            versions = {'flask': '0.10.1', 'Alembic': '0.9.1', 'sqlalchemy': '1.0'}
+            mock_find_all_candidates.side_effect = lambda project: [
+                InstallationCandidate(project, versions.get(project, '0.1'), Link('')),
+            ]
+
+            result = self.runner.invoke(pur, args)
+            self.assertIsNone(result.exception)
+            expected_output = "Updated flask: 0.9 -> 0.10.1\nUpdated Alembic: 0.9 -> 0.9.1\nUpdated sqlalchemy: 0.9 -> 1.0\nAll requirements up-to-date.\n"
+            self.assertEqual(u(result.output), u(expected_output))
+            self.assertEqual(result.exit_code, 0)
+            expected_requirements = open('tests/samples/requirements-multiple.txt').read()
+            expected_requirements = expected_requirements.replace('flask==0.9', 'flask==0.10.1')
+            expected_requirements = expected_requirements.replace('Alembic==0.9', 'Alembic==0.9.1')
+            expected_requirements = expected_requirements.replace('sqlalchemy==0.9', 'sqlalchemy==1.0')
+            self.assertEqual(open(requirements).read(), expected_requirements)
+
+    def test_jobs_keeps_order_with_nested_requirements(self):
+        tempdir = tempfile.mkdtemp()
+        requirements = os.path.join(tempdir, 'requirements-with-nested-reqfile.txt')
+        requirements_nested = os.path.join(tempdir, 'requirements-nested.txt')
+        shutil.copy('tests/samples/requirements-with-nested-reqfile.txt', requirements)
+        shutil.copy('tests/samples/requirements-nested.txt', requirements_nested)
+        args = {
+            'input_file': requirements,
+            'jobs': 4,
+        }
+
+        with patch('pip._internal.index.package_finder.PackageFinder.find_all_candidates') as mock_find_all_candidates:
+            versions = {'flask': '12.1', 'readtime': '0.10.1'}
+            mock_find_all_candidates.side_effect = lambda project: [
+                InstallationCandidate(project, versions.get(project, '0.1'), Link('')),
+            ]
+
+            result = update_requirements(**args)
+            self.assertEqual(list(result.keys()), ['flask', 'readtime'])
+            self.assertEqual([x['message'] for x in result['flask']], [
+                'Updated flask: 0.10.1 -> 12.1',
+                'Updated flask: 12.0 -> 12.1',
+            ])
+            self.assertEqual(result['readtime'][0]['message'], 'Updated readtime: 0.9 -> 0.10.1')
+            expected_requirements = open('tests/samples/results/test_updates_package_in_nested_requirements_nested').read()
+            self.assertEqual(open(requirements_nested).read(), expected_requirements)
+
+    def test_invalid_jobs(self):
+        tempdir = tempfile.mkdtemp()
+        requirements = os.path.join(tempdir, 'requirements.txt')
+        shutil.copy('tests/samples/requirements.txt', requirements)
+        args = ['-r', requirements, '--jobs', '0']
+
+        result = self.runner.invoke(pur, args)
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn('--jobs must be a positive integer.', u(result.output))
+        self.assertEqual(open(requirements).read(), open('tests/samples/requirements.txt').read())
+
+    def test_asyncio_engine(self):
+        tempdir = tempfile.mkdtemp()
+        requirements = os.path.join(tempdir, 'requirements.txt')
+        shutil.copy('tests/samples/requirements.txt', requirements)
+        args = ['-r', requirements, '--engine', 'asyncio']
+
+        page = json.dumps({
+            'meta': {'api-version': '1.0'},
+            'name': 'flask',
+            'files': [
+                {'filename': 'Flask-0.9.tar.gz', 'url': 'https://files.example.com/Flask-0.9.tar.gz', 'hashes': {}},
+                {'filename': 'Flask-0.10.1.tar.gz', 'url': 'https://files.example.com/Flask-0.10.1.tar.gz', 'hashes': {}},
+            ],
+        }).encode('utf-8')
+        requested = []
+
+        async def get(client, url, extra_headers=None):
+            requested.append(url)
+            headers = {'content-type': 'application/vnd.pypi.simple.v1+json'}
+            return 200, headers, page, url
+
+        with patch('pur.async_index.AsyncIndexClient._get', new=get):
+            with patch('pip._vendor.requests.adapters.HTTPAdapter.send') as mock_send:
+                result = self.runner.invoke(pur, args)
+                self.assertIsNone(result.exception)
+                self.assertEqual(mock_send.call_count, 0)
+            self.assertEqual(requested, ['https://pypi.org/simple/flask/', 'https://pypi.org/simple/inbox/'])
+            expected_output = "Updated flask: 0.9 -> 0.10.1\nAll requirements up-to-date.\n"
+            self.assertEqual(u(result.output), u(expected_output))
+            self.assertEqual(result.exit_code, 0)
+            expected_requirements = open('tests/samples/results/test_updates_package').read()
+            self.assertEqual(open(requirements).read(), expected_requirements)
+
+    def test_asyncio_client_reads_http_responses(self):
+        page = b'<a href="/files/flask-0.10.1.tar.gz">flask-0.10.1.tar.gz</a>'
+        connections = set()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                connections.add(self.client_address)
+                if self.path == '/simple/old/':
+                    self.send_response(301)
+                    self.send_header('Location', '/simple/gzip/')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if self.path == '/simple/missing/':
+                    self.send_error(404)
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html')
+                if self.path == '/simple/chunked/':
+                    self.send_header('Transfer-Encoding', 'chunked')
+                    self.end_headers()
+                    for chunk in (page[:10], page[10:]):
+                        self.wfile.write('{0:x}\r\n'.format(len(chunk)).encode('ascii') + chunk + b'\r\n')
+                    self.wfile.write(b'0\r\n\r\n')
+                    return
+                body = page
+                if self.path == '/simple/gzip/':
+                    body = gzip.compress(page)
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                if self.path == '/simple/closing/':
+                    # close the kept-alive connection without telling the client
+                    self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        session = PurSession()
+        with self.serve(Handler) as url:
+            urls = [url + path for path in [
+                '/simple/closing/',
+                '/simple/chunked/',
+                '/simple/old/',
+                '/simple/missing/',
+            ]]
+            # one request at a time, so connections are reused
+            pages = AsyncIndexClient(session, limit=1).fetch_pages(urls)
+        session.close()
+
+        self.assertEqual(sorted(pages), sorted(urls[:3]))
+        for page_url in urls[:3]:
+            self.assertEqual(pages[page_url].content, page)
+            self.assertEqual(pages[page_url].content_type, 'text/html')
+        self.assertEqual(pages[urls[2]].url, url + '/simple/gzip/')
+        # the server closed the first connection, so a second one was opened
+        self.assertEqual(len(connections), 2)
+
+    def test_asyncio_client_retry_counts_are_per_fetch(self):
+        requests_seen = Counter()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                requests_seen[self.path] += 1
+                if self.path == '/simple/flaky/' and requests_seen[self.path] == 1:
+                    self.send_response(503)
+                    self.send_header('Retry-After', '0')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = b'<a href="/files/flaky-1.0.tar.gz">flaky-1.0.tar.gz</a>'
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        session = PurSession(retries=1, max_backoff=0)
+        with self.serve(Handler) as url:
+            finder = build_package_finder(session=session, index_urls=[url + '/simple/'])
+            collector = finder._link_collector
+            client = AsyncIndexClient(session)
+
+            collector.prefetch(client, ['flaky'])
+            self.assertEqual(client.retry_counts, {url + '/simple/flaky/': 1})
+            collector.fetch_response(Link(url + '/simple/flaky/'))
+            self.assertEqual(collector.prefetched_retries, {})
+
+            collector.prefetch(client, ['steady'])
+            self.assertEqual(client.retry_counts, {})
+            self.assertEqual(collector.prefetched_retries, {})
+        session.close()
+
+    def test_asyncio_client_revalidates_cached_pages(self):
+        page = b'<a href="/files/flask-0.10.1.tar.gz">flask-0.10.1.tar.gz</a>'
+        requests_seen = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                requests_seen.append(self.headers.get('If-None-Match'))
+                if self.headers.get('If-None-Match') == '"v1"':
+                    self.send_response(304)
+                    self.send_header('ETag', '"v1"')
+                    self.end_headers()
+                    return
+                body = gzip.compress(page)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Encoding', 'gzip')
+                self.send_header('ETag', '"v1"')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        cache_dir = tempfile.mkdtemp()
+        with self.serve(Handler) as url:
+            # cache http:// pages like pages from a trusted host
+            session = PurSession(cache=cache_dir, trusted_hosts=['127.0.0.1'])
+            page_url = url + '/simple/flask/'
+            for _ in range(2):
+                pages = AsyncIndexClient(session).fetch_pages([page_url])
+                self.assertEqual(pages[page_url].content, page)
+            session.close()
+
+        self.assertEqual(requests_seen, [None, '"v1"'])
+
+    def test_asyncio_engine_falls_back_to_session(self):
+        tempdir = tempfile.mkdtemp()
+        requirements = os.path.join(tempdir, 'requirements.txt')
+        with open(requirements, 'w') as fh:
+            fh.write('flask==0.9\n')
+        requested = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                requested.append(self.path)
+                self.send_error(404)
+
+            def log_message(self, *args):
+                pass
+
+        with self.serve(Handler) as url:
+            result = update_requirements(
+                input_file=requirements,
+                dry_run=True,
+                index_urls=[url + '/simple/'],
+                no_cache=True,
+                engine='asyncio',
+            )
+
+        self.assertEqual(result, {})
+        # once from the asyncio client, then again with the session
+        self.assertEqual(requested, ['/simple/flask/'] * 2)
+
+    def test_nested_requirements_share_session_and_finder(self):
+        tempdir = tempfile.mkdtemp()
+        requirements = os.path.join(tempdir, 'requirements-with-nested-reqfile.txt')
+        requirements_nested = os.path.join(tempdir, 'requirements-nested.txt')
+        shutil.copy('tests/samples/requirements-with-nested-reqfile.txt', requirements)
+        shutil.copy('tests/samples/requirements-nested.txt', requirements_nested)
+        args = ['-r', requirements]
+
+        with patch('pur.PurSession', wraps=PurSession) as mock_session, \
+                patch('pur.build_package_finder', wraps=build_package_finder) as mock_build_package_finder, \
+                patch('pip._internal.index.package_finder.PackageFinder.find_all_candidates') as mock_find_all_candidates:
+            project = 'readtime'
+            version = '0.10.1'
+            link = Link('')
+            candidate = InstallationCandidate(project, version, link)
+            mock_find_all_candidates.return_value = [candidate]
+
+            result = self.runner.invoke(pur, args)
+            self.assertIsNone(result.exception)
+            expected_output = "Updated readtime: 0.9 -> 0.10.1\nAll requirements up-to-date.\n"
+            self.assertEqual(u(result.output), u(expected_output))
+            self.assertEqual(result.exit_code, 0)
+            self.assertEqual(mock_session.call_count, 1)
+            self.assertEqual(mock_build_package_finder.call_count, 1)
+            expected_requirements = open('tests/samples/results/test_updates_package_in_nested_requirements_nested').read()
+            self.assertEqual(open(requirements_nested).read(), expected_requirements)
+
+    def test_index_url_in_nested_requirements_only_applies_to_nested_file(self):
+        tempdir = tempfile.mkdtemp()
+        requirements = os.path.join(tempdir, 'requirements.txt')
+        with open(requirements, 'w') as fh:
+            fh.write('-r nested.txt\nflask==0.9\n')
+        with open(os.path.join(tempdir, 'nested.txt'), 'w') as fh:
+            fh.write('--index-url https://private.example.com/simple\nflask==0.9\n')
+
+        def fetch_response(location):
+            fetched.append(location.url)
+            version = '0.11' if location.url.startswith('https://private') else '0.10.1'
+            return IndexContent(
+                json.dumps({
+                    'meta': {'api-version': '1.0'},
+                    'name': 'flask',
+                    'files': [{
+                        'filename': 'flask-{0}.tar.gz'.format(version),
+                        'url': 'https://files.example.com/flask-{0}.tar.gz'.format(version),
+                        'hashes': {},
+                    }],
+                }).encode('utf-8'),
+                'application/vnd.pypi.simple.v1+json',
+                encoding=None,
+                url=location.url,
+                cache_link_parsing=False,
+            )
+
+        for jobs in ['1', '4']:
+            fetched = []
+            with patch('pip._internal.index.collector.LinkCollector.fetch_response', side_effect=fetch_response):
+                result = self.runner.invoke(pur, ['-r', requirements, '--dry-run', '--no-cache', '--jobs', jobs])
+            self.assertIsNone(result.exception)
+            self.assertEqual(result.exit_code, 0)
+            self.assertEqual(fetched, [
+                'https://private.example.com/simple/flask/',
+                'https://pypi.org/simple/flask/',
+            ])
+            self.assertEqual(u(result.output), '==> ' + os.path.join(tempdir, 'nested.txt') + ' <==\n' +
+                             '--index-url https://private.example.com/simple\nflask==0.11\n\n' +
+                             '==> ' + requirements + ' <==\n' +
+                             '-r nested.txt\nflask==0.10.1\n\n')
+
+    def test_cache_dir(self):
+        tempdir = tempfile.mkdtemp()
+        requirements = os.path.join(tempdir, 'requirements.txt')
+        cache_dir = os.path.join(tempdir, 'cache')
+        shutil.copy('tests/samples/requirements.txt', requirements)
+        args = ['-r', requirements, '--cache-dir', cache_dir]
+
+        with patch('pur.PurSession', wraps=PurSession) as mock_session, \
+                patch('pip._internal.index.package_finder.PackageFinder.find_all_candidates') as mock_find_all_candidates:
+            project = 'flask'
+            version = '0.10.1'
+            link = Link('')
+            candidate = InstallationCandidate(project, version, link)
+            mock_find_all_candidates.return_value = [candidate]
+
+            result = self.runner.invoke(pur, args)
+            self.assertIsNone(result.exception)
+            self.assertEqual(result.exit_code, 0)
+            self.assertEqual(mock_session.call_args[1]['cache'], cache_dir)
+
+            result = self.runner.invoke(pur, args + ['--no-cache'])
+            self.assertIsNone(result.exception)
+            self.assertEqual(result.exit_code, 0)
+            self.assertIsNone(mock_session.call_args[1]['cache'])
+
+    def test_cache_keys_are_normalized(self):
+        expected = 'https://pypi.example.com/simple/flask/'
+        urls = [
+            'https://pypi.example.com/simple/flask/',
+            'HTTPS://PyPI.Example.com/simple/flask/',
+            'https://pypi.example.com:443/simple/flask/',
+            'https://pypi.example.com/simple//flask/',
+            'https://pypi.example.com/simple/./flask/#fragment',
+        ]
+        for url in urls:
+            self.assertEqual(PurCacheController.cache_url(url), expected)
+        self.assertEqual(PurCacheController.cache_url('http://pypi.example.com:8080/simple/flask/'),
+                         'http://pypi.example.com:8080/simple/flask/')
+
+    def test_index_ttl(self):
+        tempdir = tempfile.mkdtemp()
+        requirements = os.path.join(tempdir, 'requirements.txt')
+        shutil.copy('tests/samples/requirements.txt', requirements)
+        args = ['-r', requirements, '--index-ttl', '300']
+
+        with patch('pur.PurSession', wraps=PurSession) as mock_session, \
+                patch('pip._internal.index.package_finder.PackageFinder.find_all_candidates') as mock_find_all_candidates:
+            project = 'flask'
+            version = '0.10.1'
+            link = Link('')
+            candidate = InstallationCandidate(project, version, link)
+            mock_find_all_candidates.return_value = [candidate]
+
+            result = self.runner.invoke(pur, args)
+            self.assertIsNone(result.exception)
+            self.assertEqual(result.exit_code, 0)
+            self.assertEqual(mock_session.call_args[1]['index_ttl'], 300)
+
+        result = self.runner.invoke(pur, ['-r', requirements, '--index-ttl', '-1'])
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn('--index-ttl must be a non-negative integer.', result.output)
+
+    def test_index_ttl_serves_stale_pages_while_refreshing(self):
+        stale = []
+        controller = PurCacheController(ttl=300, on_stale=stale.append)
+        request = requests.Request(
+            'GET', 'https://pypi.example.com/simple/flask/',
+            headers={'Cache-Control': 'max-age=0'},
+        ).prepare()
+
+        def cached_response(age):
+            response = Mock()
+            response.headers = {'date': formatdate(time.time() - age, usegmt=True)}
+            return response
+
+        with patch('pip._vendor.cachecontrol.controller.CacheController.cached_request') as mock_cached_request:
+            mock_cached_request.return_value = cached_response(60)
+            self.assertTrue(controller.cached_request(request))
+            self.assertEqual(mock_cached_request.call_args[0][0].headers['Cache-Control'],
+                             'max-age={0}'.format(300 + controller.max_stale))
+            self.assertEqual(request.headers['Cache-Control'], 'max-age=0')
+            self.assertEqual(stale, [])
+
+            mock_cached_request.return_value = cached_response(600)
+            self.assertTrue(controller.cached_request(request))
+            self.assertEqual(stale, [request])
+
+            # requests not coming from pip's index page fetch are untouched
+            other = request.copy()
+            other.headers['Cache-Control'] = 'no-cache'
+            controller.cached_request(other)
+            self.assertEqual(mock_cached_request.call_args[0][0].headers['Cache-Control'], 'no-cache')
+
+    def test_cooldown_uses_upload_times_from_index(self):
+        tempdir = tempfile.mkdtemp()
+        requirements = os.path.join(tempdir, 'requirements.txt')
+        with open(requirements, 'w') as fh:
+            fh.write('flask==0.9\n')
+        args = ['-r', requirements, '--cooldown-days', '30', '--no-cache']
+
+        def upload_time(days):
+            dt = datetime.now(timezone.utc) - timedelta(days=days)
+            return dt.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+        page = IndexContent(
+            json.dumps({
+                'meta': {'api-version': '1.1'},
+                'name': 'flask',
+                'files': [
+                    {
+                        'filename': 'flask-0.10.1.tar.gz',
+                        'url': 'https://files.example.com/flask-0.10.1.tar.gz',
+                        'hashes': {},
+                        'upload-time': upload_time(400),
+                    },
+                    {
+                        'filename': 'flask-0.11.tar.gz',
+                        'url': 'https://files.example.com/flask-0.11.tar.gz',
+                        'hashes': {},
+                        'upload-time': upload_time(2),
+                    },
+                ],
+            }).encode('utf-8'),
+            'application/vnd.pypi.simple.v1+json',
+            encoding=None,
+            url='https://pypi.org/simple/flask/',
+        )
+
+        with patch('pip._internal.index.collector.LinkCollector.fetch_response') as mock_fetch_response, \
+                patch('pur.utils.get_package_release_dates') as mock_get_package_release_dates:
+            mock_fetch_response.return_value = page
+
+            result = self.runner.invoke(pur, args)
+            self.assertIsNone(result.exception)
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn('Updated flask: 0.9 -> 0.10.1', u(result.output))
+            self.assertFalse(mock_get_package_release_dates.called)
+
+    def test_upload_times_only_read_with_cooldown(self):
+        tempdir = tempfile.mkdtemp()
+        requirements = os.path.join(tempdir, 'requirements.txt')
+        with open(requirements, 'w') as fh:
+            fh.write('flask==0.9\n')
+
+        page = IndexContent(
+            json.dumps({
+                'meta': {'api-version': '1.1'},
+                'name': 'flask',
+                'files': [{
+                    'filename': 'flask-0.10.1.tar.gz',
+                    'url': 'https://files.example.com/flask-0.10.1.tar.gz',
+                    'hashes': {},
+                    'upload-time': '2013-06-14T00:00:00.000000Z',
+                }],
+            }).encode('utf-8'),
+            'application/vnd.pypi.simple.v1+json',
+            encoding=None,
+            url='https://pypi.org/simple/flask/',
+            cache_link_parsing=False,
+        )
+
+        with patch('pip._internal.index.collector.LinkCollector.fetch_response') as mock_fetch_response, \
+                patch('pur.index.get_upload_times') as mock_get_upload_times:
+            mock_fetch_response.return_value = page
+
+            result = update_requirements(input_file=requirements, dry_run=True, no_cache=True)
+            self.assertEqual(result['flask'][0]['latest'], Version('0.10.1'))
+            self.assertFalse(mock_get_upload_times.called)
+
+    def test_cooldown_falls_back_to_json_api_once_per_package(self):
+        tempdir = tempfile.mkdtemp()
+        requirements = os.path.join(tempdir, 'requirements.txt')
+        with open(requirements, 'w') as fh:
+            fh.write('flask==0.9\n-r nested.txt\n')
+        with open(os.path.join(tempdir, 'nested.txt'), 'w') as fh:
+            fh.write('flask==0.9\n')
+        args = ['-r', requirements, '--cooldown-days', '30', '--no-cache']
+
+        with patch('pip._internal.index.package_finder.PackageFinder.find_all_candidates') as mock_find_all_candidates, \
+                patch('pur.utils.get_package_release_dates') as mock_get_package_release_dates:
+            mock_find_all_candidates.return_value = [
+                InstallationCandidate('flask', '0.10.1', Link('')),
+                InstallationCandidate('flask', '0.11', Link('')),
+            ]
+            mock_get_package_release_dates.return_value = {
+                '0.10.1': datetime.now(timezone.utc) - timedelta(days=400),
+                '0.11': datetime.now(timezone.utc) - timedelta(days=2),
+            }
+
+            result = self.runner.invoke(pur, args)
+            self.assertIsNone(result.exception)
+            self.assertEqual(result.exit_code, 0)
+            self.assertEqual(u(result.output).count('Updated flask: 0.9 -> 0.10.1'), 2)
+            self.assertEqual(mock_get_package_release_dates.call_count, 1)
+
+    def test_preconnect_only_with_jobs_and_lookups(self):
+        tempdir = tempfile.mkdtemp()
+        requirements = os.path.join(tempdir, 'requirements.txt')
+        shutil.copy('tests/samples/requirements.txt', requirements)
+
+        with patch('pip._internal.index.package_finder.PackageFinder.find_all_candidates') as mock_find_all_candidates:
+            mock_find_all_candidates.return_value = [InstallationCandidate('flask', '0.10.1', Link(''))]
+
+            update_requirements(input_file=requirements, dry_run=True, no_cache=True)
+            self.assertFalse(self.mock_preconnect.called)
+
+            update_requirements(input_file=requirements, dry_run=True, no_cache=True,
+                                jobs=4, only=['nothing'])
+            self.assertFalse(self.mock_preconnect.called)
+
+            update_requirements(input_file=requirements, dry_run=True, no_cache=True, jobs=4)
+            self.mock_preconnect.assert_called_once_with(['https://pypi.org/simple'], connections=4)
+
+    def test_indexes_are_fetched_in_parallel(self):
+        tempdir = tempfile.mkdtemp()
+        requirements = os.path.join(tempdir, 'requirements.txt')
+        with open(requirements, 'w') as fh:
+            fh.write('flask==0.9\n')
+        second_index_requested = threading.Event()
+        waited = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith('/first/'):
+                    # only answers once the second index was asked too
+                    waited.append(second_index_requested.wait(5))
+                    version = '0.10.1'
+                else:
+                    second_index_requested.set()
+                    version = '0.11'
+                body = '<a href="/files/flask-{0}.tar.gz">flask-{0}.tar.gz</a>'.format(version).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        with self.serve(Handler) as url:
+            result = update_requirements(
+                input_file=requirements,
+                dry_run=True,
+                index_urls=[url + '/first/simple/', url + '/second/simple/'],
+                no_cache=True,
+            )
+
+        self.assertEqual(waited, [True])
+        self.assertEqual(result['flask'][0]['latest'], Version('0.11'))
+
+    def test_pool_size_follows_jobs(self):
+        tempdir = tempfile.mkdtemp()
+        requirements = os.path.join(tempdir, 'requirements.txt')
+        shutil.copy('tests/samples/requirements.txt', requirements)
+        args = ['-r', requirements, '--jobs', '20', '--index-url', 'https://pypi.example.com/simple/']
+
+        with patch('pur.PurSession', wraps=PurSession) as mock_session, \
+                patch('pur.session.PurSession.preconnect') as mock_preconnect, \
+                patch('pip._internal.index.package_finder.PackageFinder.find_all_candidates') as mock_find_all_candidates:
+            project = 'flask'
+            version = '0.10.1'
+            link = Link('')
+            candidate = InstallationCandidate(project, version, link)
+            mock_find_all_candidates.return_value = [candidate]
+
+            result = self.runner.invoke(pur, args)
+            self.assertIsNone(result.exception)
+            self.assertEqual(result.exit_code, 0)
+            self.assertEqual(mock_session.call_args[1]['pool_maxsize'], 20)
+            mock_preconnect.assert_called_once_with(('https://pypi.example.com/simple/',), connections=10)
+
+        session = PurSession(pool_maxsize=20)
+        adapter = session.get_adapter('https://pypi.example.com/simple/')
+        self.assertEqual(adapter.poolmanager.connection_pool_kw['maxsize'], 20)
+        session.close()
+
+    def test_retries_are_capped_by_max_backoff(self):
+        retry = PurRetry(total=5, backoff_factor=10, max_backoff=2)
+        for _ in range(3):
+            retry = retry.increment(method='GET', url='/simple/flask/')
+        self.assertEqual(retry.max_backoff, 2)
+        self.assertEqual(retry.get_backoff_time(), 2)
+
+        response = Mock()
+        response.headers = {'Retry-After': '60'}
+        self.assertEqual(retry.get_retry_after(response), 2)
+
+    def test_retries_reported_in_updates(self):
+        for engine in ['threads', 'asyncio']:
+            self._test_retries_reported_in_updates(engine)
+
+    def _test_retries_reported_in_updates(self, engine):
+        tempdir = tempfile.mkdtemp()
+        requirements = os.path.join(tempdir, 'requirements.txt')
+        with open(requirements, 'w') as fh:
+            fh.write('flask==0.9\n')
+
+        attempts = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                attempts.append(self.path)
+                if len(attempts) < 3:
+                    self.send_response(429 if len(attempts) == 1 else 503)
+                    self.send_header('Retry-After', '30')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = b'<a href="/files/flask-0.10.1.tar.gz">flask-0.10.1.tar.gz</a>'
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        with self.serve(Handler) as url:
+            result = update_requirements(
+                input_file=requirements,
+                dry_run=True,
+                index_urls=[url + '/simple/'],
+                no_cache=True,
+                retries=2,
+                max_backoff=0,
+                engine=engine,
+            )
+
+        self.assertEqual(attempts, ['/simple/flask/'] * 3)
+        self.assertEqual(result['flask'][0]['latest'], Version('0.10.1'))
+        self.assertEqual(result['flask'][0]['retries'], 2)
+
+    def test_failing_index_host_is_skipped(self):
+        for engine in ['threads', 'asyncio']:
+            self._test_failing_index_host_is_skipped(engine)
+
+    def _test_failing_index_host_is_skipped(self, engine):
+        tempdir = tempfile.mkdtemp()
+        requirements = os.path.join(tempdir, 'requirements.txt')
+        with open(requirements, 'w') as fh:
+            fh.write('flask==0.9\nsix==0.9\nrequests==0.9\n')
+
+        failed = []
+
+        class FailingHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                failed.append(self.path)
+                self.send_response(503)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                name = self.path.split('/')[2]
+                body = '<a href="/files/{0}-1.0.tar.gz">{0}-1.0.tar.gz</a>'.format(name).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        with self.serve(FailingHandler) as failing_url, self.serve(Handler) as url:
+            args = [
+                '-r', requirements, '--dry-run', '--no-cache', '--retries', '0',
+                '--max-host-failures', '2', '--engine', engine,
+                '--index-url', failing_url + '/simple/', '--index-url', url + '/simple/',
+            ]
+            if engine == 'threads':
+                args += ['--jobs', '1']
+            result = self.runner.invoke(pur, args)
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('flask==1.0\nsix==1.0\nrequests==1.0\n', result.output)
+        host = failing_url.split('//')[1]
+        for package in ['flask', 'six', 'requests']:
+            self.assertIn('Could not reach {0} for {1}, latest version may be stale'.format(
+                host, package,
+            ), result.output)
+        if engine == 'threads':
+            self.assertEqual(failed, ['/simple/flask/', '/simple/six/'])
+
+    def test_host_stats(self):
+        session = PurSession(max_host_failures=2)
+        session.record_request('pypi.example.com', 0.5)
+        session.record_request('pypi.example.com', 1.5, failed=True)
+        self.assertFalse(session.is_host_down('pypi.example.com'))
+        session.record_request('pypi.example.com', 1.0, failed=True)
+        self.assertTrue(session.is_host_down('pypi.example.com'))
+        self.assertFalse(session.is_host_down('other.example.com'))
+
+        stats = session.host_stats['pypi.example.com']
+        self.assertEqual(stats.requests, 3)
+        self.assertEqual(stats.failures, 2)
+        self.assertEqual(stats.average_seconds, 1.0)
+
+        with session.track_requests() as request_stats:
+            with self.assertRaises(requests.ConnectionError):
+                session.get('https://pypi.example.com/simple/flask/')
+        self.assertEqual(request_stats.unreachable_hosts, {'pypi.example.com'})
+        session.close()
+
+    def test_json_index(self):
+        for engine in ['threads', 'asyncio']:
+            self._test_json_index(engine)
+
+    def _test_json_index(self, engine):
+        tempdir = tempfile.mkdtemp()
+        requirements = os.path.join(tempdir, 'requirements.txt')
+        with open(requirements, 'w') as fh:
+            fh.write('flask==0.9\nsix==0.9\n')
+
+        accepted = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                accepted.append(self.headers['Accept'])
+                if self.path == '/simple/flask/':
+                    content_type = 'application/vnd.pypi.simple.v1+json'
+                    body = json.dumps({
+                        'meta': {'api-version': '1.1'},
+                        'name': 'flask',
+                        'files': [{
+                            'filename': 'flask-0.10.1.tar.gz',
+                            'url': '/files/flask-0.10.1.tar.gz',
+                            'hashes': {},
+                        }],
+                    }).encode()
+                else:
+                    content_type = 'text/html'
+                    body = b'<a href="/files/six-1.0.tar.gz">six-1.0.tar.gz</a>'
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        with self.serve(Handler) as url:
+            result = update_requirements(
+                input_file=requirements,
+                dry_run=True,
+                index_urls=[url + '/simple/'],
+                no_cache=True,
+                json_index=True,
+                engine=engine,
+            )
+
+        self.assertEqual(set(accepted), {'application/vnd.pypi.simple.v1+json'})
+        self.assertEqual(result['flask'][0]['latest'], Version('0.10.1'))
+        # html pages are skipped
+        self.assertNotIn('six', result)
+
+    def test_index_pages_are_parsed_in_chunks(self):
+        html = (
+            '<html><head><base href="https://files.example.com/">\n</head><body>\n' +
+            ''.join(
+                '<a href="flask-{0}.tar.gz#sha256=abc" data-requires-python="&gt;=3.{0}">'
+                'flask-{0}.tar.gz</a><br/>\n'.format(i) for i in range(20)
+            ) +
+            '<a href="flask-9.9.tar.gz" data-yanked="caf\u00e9">flask-9.9.tar.gz</a>\n'
+            '</body></html>'
+        ).encode('utf-8')
+        data = json.dumps({
+            'meta': {'api-version': '1.1', 'note': '}]"files"'},
+            'name': 'flask',
+            'files': [{
+                'filename': 'flask-{0}.tar.gz'.format(i),
+                'url': 'https://files.example.com/flask-{0}.tar.gz'.format(i),
+                'hashes': {'sha256': 'abc'},
+                'requires-python': '>=3.{0}'.format(i),
+                'yanked': i == 3 and 'caf\u00e9',
+                'size': 12345678901234567890,
+            } for i in range(20)],
+            'versions': ['{0}'.format(i) for i in range(20)],
+        }, ensure_ascii=False).encode('utf-8')
+        pages = [
+            IndexContent(html, 'text/html', encoding=None,
+                         url='https://pypi.example.com/simple/flask/',
+                         cache_link_parsing=False),
+            IndexContent(data, 'application/vnd.pypi.simple.v1+json', encoding=None,
+                         url='https://pypi.example.com/simple/flask/',
+                         cache_link_parsing=False),
+        ]
+
+        def links(links):
+            return [
+                (link.url, link.requires_python, link.yanked_reason)
+                for link in links
+            ]
+
+        for page in pages:
+            expected = links(parse_links(page))
+            self.assertEqual(len(expected), 21 if page is pages[0] else 20)
+            for chunk_size in [1, 7, 4096]:
+                self.assertEqual(links(iter_links(page, chunk_size=chunk_size)), expected)
+
+        page = IndexContent(b'{"files": [{"filename": ', 'application/vnd.pypi.simple.v1+json',
+                            encoding=None, url='https://pypi.example.com/simple/flask/')
+        with self.assertRaises(ValueError):
+            list(iter_links(page, chunk_size=4))
+
+    def test_plain_html_pages_are_scanned(self):
+        anchors = (
+            '<a href="flask-1.0.tar.gz" data-requires-python="&gt;=3.6">flask-1.0.tar.gz</a><br/>\n'
+            '<A HREF=\'flask-1.1.tar.gz\' data-yanked>flask-1.1.tar.gz</A>\n'
+            '<a href=flask-1.2.tar.gz data-yanked="">flask-1.2.tar.gz</a>\n'
+            '<a\nhref="flask-1.3.tar.gz"\ndata-yanked="bad &amp; broken" />\n'
+        )
+        pages = {
+            'plain': anchors + '<!--SERIAL 1-->',
+            'base': '<base href="https://files.example.com/">' + anchors,
+            'comment': '<!-- <a href="flask-0.1.tar.gz"> -->' + anchors,
+            'unscannable': anchors + '<a href="flask-2.0.tar.gz" =x>' + anchors,
+        }
+        for name, html in pages.items():
+            page = IndexContent(html.encode('utf-8'), 'text/html', encoding=None,
+                                url='https://pypi.example.com/simple/flask/',
+                                cache_link_parsing=False)
+            expected = [
+                (link.url, link.requires_python, link.yanked_reason)
+                for link in parse_links(page)
+            ]
+            self.assertEqual(len(expected), 9 if name == 'unscannable' else 4, name)
+            with patch('pur.index.HTMLLinkParser.feed') as mock_feed:
+                list(iter_links(page))
+            self.assertEqual(mock_feed.called, name != 'plain', name)
+            self.assertEqual([
+                (link.url, link.requires_python, link.yanked_reason)
+                for link in iter_links(page, chunk_size=5)
+            ], expected, name)
+
+    def test_candidates_are_found_once_per_version(self):
+        files = [
+            ('foo-2.0-cp27-cp27m-win32.whl', {}),
+            ('foo-2.0.tar.gz', {'yanked': 'broken'}),
+            ('foo-2.0-py3-none-any.whl', {}),
+            ('foo-2.0-py2.py3-none-any.whl', {}),
+            ('foo-1.0.tar.gz', {'requires-python': '<3'}),
+            ('foo-1.0.zip', {'yanked': ''}),
+            ('foo-1.0-py3-none-any.whl', {}),
+            ('foo-0.5.tar.gz', {'yanked': False}),
+        ]
+        data = json.dumps({
+            'meta': {'api-version': '1.1'},
+            'name': 'foo',
+            'files': [
+                dict(filename=filename, url='/files/' + filename, hashes={}, **extra)
+                for filename, extra in files
+            ],
+        }).encode()
+        page = IndexContent(data, 'application/vnd.pypi.simple.v1+json', encoding=None,
+                            url='https://pypi.example.com/simple/foo/',
+                            cache_link_parsing=False)
+
+        session = PurSession()
+        finder = build_package_finder(session=session,
+                                      index_urls=['https://pypi.example.com/simple/'])
+        with patch('pur.index.PurLinkCollector.fetch_response', return_value=page), \
+                patch('pur.index.Link.from_json', wraps=Link.from_json) as mock_from_json:
+            candidates = finder.find_all_candidates('foo')
+        session.close()
+
+        self.assertEqual([(c.version, c.link.filename) for c in candidates], [
+            (Version('2.0'), 'foo-2.0-py3-none-any.whl'),
+            (Version('1.0'), 'foo-1.0.zip'),
+            (Version('0.5'), 'foo-0.5.tar.gz'),
+        ])
+        self.assertEqual(mock_from_json.call_count, 3)
+
+    def test_requires_python_is_parsed_once(self):
+        files = [
+            ('foo-{0}.tar.gz'.format(version), requires_python)
+            for version, requires_python in [
+                ('3.0', '>=99'), ('2.2', '>=3.6'), ('2.1', '>=3.6'), ('2.0', '>=3.6'),
+                ('1.1', '=>3'), ('1.0', None),
+            ]
+        ]
+        data = json.dumps({
+            'meta': {'api-version': '1.0'},
+            'name': 'foo',
+            'files': [
+                {'filename': filename, 'url': '/files/' + filename, 'hashes': {},
+                 'requires-python': requires_python}
+                for filename, requires_python in files
+            ],
+        }).encode()
+        page = IndexContent(data, 'application/vnd.pypi.simple.v1+json', encoding=None,
+                            url='https://pypi.example.com/simple/foo/',
+                            cache_link_parsing=False)
+
+        session = PurSession()
+        finder = build_package_finder(session=session,
+                                      index_urls=['https://pypi.example.com/simple/'])
+        supports_requires_python.cache_clear()
+        with patch('pur.index.PurLinkCollector.fetch_response', return_value=page), \
+                patch('pur.index.check_requires_python', wraps=check_requires_python) as mock_check, \
+                patch('pip._internal.index.package_finder.check_requires_python',
+                      wraps=check_requires_python) as mock_pip_check:
+            candidates = finder.find_all_candidates('foo')
+        session.close()
+
+        self.assertEqual([str(c.version) for c in candidates], ['2.2', '2.1', '2.0', '1.1', '1.0'])
+        self.assertEqual(candidates[0].link.requires_python, '>=3.6')
+        self.assertEqual(mock_check.call_count, 3)
+        # pip only sees links without Requires-Python, which it doesn't parse
+        self.assertEqual({call.args[0] for call in mock_pip_check.call_args_list}, {None})
+
+    def test_candidates_are_ranked_by_version(self):
+        session = PurSession()
+        finder = build_package_finder(session=session,
+                                      index_urls=['https://pypi.example.com/simple/'])
+        candidates = [
+            InstallationCandidate('foo', version, Link(url, yanked_reason=yanked))
+            for version, url, yanked in [
+                ('3.0', 'https://files.example.com/foo-3.0.tar.gz', 'broken'),
+                ('2.0', 'https://files.example.com/foo-2.0-py3-none-any.whl', None),
+                ('2.5', 'https://files.example.com/foo-2.5.tar.gz', None),
+                ('1.0', 'https://files.example.com/foo-1.0-cp27-cp27m-win32.whl', None),
+            ]
+        ]
+
+        with patch('pip._internal.models.target_python.TargetPython.get_tags') as mock_get_tags:
+            evaluator = finder.make_candidate_evaluator(project_name='foo')
+            best = evaluator.sort_best_candidate(evaluator.get_applicable_candidates(candidates))
+            self.assertEqual(best.version, Version('2.5'))
+
+            finder.set_prefer_binary()
+            evaluator = finder.make_candidate_evaluator(project_name='foo')
+            best = evaluator.sort_best_candidate(evaluator.get_applicable_candidates(candidates))
+            self.assertEqual(best.version, Version('2.0'))
+        mock_get_tags.assert_not_called()
+        session.close()
+
+    def test_latest_version_stops_at_newest_match(self):
+        session = PurSession()
+        finder = build_package_finder(session=session,
+                                      index_urls=['https://pypi.example.com/simple/'])
+        candidates = [
+            InstallationCandidate('foo', version, Link(
+                'https://files.example.com/foo-{0}.tar.gz'.format(version)))
+            for version in ['0.9', '1.0', '1.1', '1.1', '1.2.1', '2.0', '2.1rc1']
+        ]
+        req = Mock()
+        req.name = 'foo'
+        spec_ver = (Version('1.0'), None, None, None, None, None)
+
+        with patch('pip._internal.index.package_finder.PackageFinder.find_all_candidates') as mock_find_all_candidates, \
+                patch('pur.index.PurCandidateEvaluator.get_applicable_candidates',
+                      side_effect=lambda c: c) as mock_applicable:
+            mock_find_all_candidates.return_value = candidates
+
+            self.assertEqual(latest_version(req, spec_ver, finder), Version('2.0'))
+            self.assertEqual(mock_applicable.call_count, 1)
+
+            mock_applicable.reset_mock()
+            self.assertEqual(latest_version(req, spec_ver, finder, minor=['foo']), Version('1.2.1'))
+            self.assertEqual(mock_applicable.call_count, 1)
+            self.assertEqual(mock_applicable.call_args[0][0], [candidates[4]])
+
+            self.assertEqual(latest_version(req, spec_ver, finder, patch=['*']), Version('1.0'))
+            self.assertEqual(latest_version(req, spec_ver, finder, pre=['foo']), Version('2.1rc1'))
+        session.close()
+
+    def test_version_index(self):
+        versions = ['2.0', '0.9', '1.0', '1.1.post1', '1.2rc1', '1.10.3', '1!0.1', '1.2', '1.1', 'dev-r12']
+        index = VersionIndex([
+            InstallationCandidate('foo', version, Link('https://files.example.com/foo-{0}.tar.gz'.format(version)))
+            for version in versions + ['1.1']
+        ])
+        self.assertEqual([str(v) for v in index.newest_first()], [
+            '1!0.1', '2.0', '1.10.3', '1.2', '1.2rc1', '1.1.post1', '1.1', '1.0', '0.9', 'dev-r12',
+        ])
+        self.assertEqual(len(index.candidates[Version('1.1')]), 2)
+
+        def newest(stop):
+            return str(next(index.newest_first(stop)))
+
+        self.assertEqual(newest(index.stop_within_major(Version('1.0'))), '1.10.3')
+        self.assertEqual(newest(index.stop_within_minor(Version('1.1'))), '1.1.post1')
+        self.assertEqual(newest(index.stop_within_minor(Version('1.2.5'))), '1.2')
+        self.assertEqual(newest(index.stop_within_minor(Version('1'))), '1.10.3')
+        self.assertEqual(newest(index.stop_within_major(Version('3.0'))), '2.0')
+        self.assertEqual(newest(index.stop_within_major(Version('1!0.0'))), '1!0.1')
+        self.assertEqual(newest(index.stop_within_major(Version('0.1'))), '0.9')
+        self.assertEqual(list(index.newest_first(0)), [])
+
+    def test_versions_are_parsed_once(self):
+        with patch('pur.versions.parse', wraps=parse) as mock_parse:
+            candidates = [
+                PurCandidate('foo', version, Link('https://files.example.com/foo-{0}-{1}.tar.gz'.format(version, i)))
+                for i, version in enumerate(['77.0.1', '77.0.2', '77.0.1', '77.1rc1', '77.0.2'])
+            ]
+            self.assertEqual(parse_version('77.0.1'), Version('77.0.1'))
+        self.assertEqual(mock_parse.call_count, 3)
+        self.assertIs(candidates[0].version, candidates[2].version)
+        self.assertEqual(candidates[0].link.url, 'https://files.example.com/foo-77.0.1-0.tar.gz')
+
+        evaluator = PurCandidateEvaluator.create('foo', specifier=SpecifierSet('<77.0.2'))
+        self.assertEqual(evaluator.get_applicable_candidates(candidates), [candidates[0], candidates[2]])
+        evaluator = PurCandidateEvaluator.create('foo', allow_all_prereleases=True)
+        self.assertEqual(evaluator.sort_best_candidate(candidates).version, Version('77.1rc1'))
+
+    def test_candidates_build_links_on_demand(self):
+        page = Mock(url='https://pypi.example.com/simple/foo/')
+        link = Link(
+            'https://files.example.com/foo-1.0-py3-none-any.whl#md5=abc',
+            comes_from=page,
+            requires_python='>=3.8',
+            yanked_reason='broken',
+            hashes={'sha256': 'def'},
+        )
+        candidate = PurCandidate('foo', '1.0', link)
+        self.assertFalse(hasattr(candidate, '__dict__'))
+        self.assertNotIn(page, [getattr(candidate, slot) for slot in PurCandidate.__slots__])
+        self.assertTrue(candidate.is_yanked)
+        self.assertTrue(candidate.is_wheel)
+        self.assertEqual(candidate, PurCandidate('foo', '1.0', link))
+
+        rebuilt = candidate.link
+        self.assertIsNot(rebuilt, link)
+        self.assertEqual(rebuilt, link)
+        self.assertEqual(rebuilt.comes_from, page.url)
+        self.assertEqual(rebuilt.requires_python, '>=3.8')
+        self.assertEqual(rebuilt.yanked_reason, 'broken')
+        self.assertEqual(rebuilt._hashes, {'sha256': 'def', 'md5': 'abc'})
+
+    def test_line_parser_only_uses_optparse_for_options(self):
+        session = PurSession()
+        finder = build_package_finder(session=session,
+                                      index_urls=['https://pypi.example.com/simple/'])
+        session.close()
+        lines = [
+            'flask==0.10.1',
+            'flask[async]>=2.0 ; python_version >= "3.8"',
+            'foo-bar==1.0    --hash=sha256:abc --hash sha256:def --hash=sha512:a:b',
+            'foo==1.0 --hash=sha256:"abc"',
+            'foo==1.0 --hash=sha256:abc --no-binary :all:',
+            '-e git+https://github.com/example/foo.git#egg=foo',
+            '--index-url https://pypi.example.com/simple/',
+            '',
+        ]
+        pip_parse_line = get_line_parser(finder)
+        expected = [pip_parse_line(line) for line in lines]
+        with patch('pip._internal.req.req_file.build_parser',
+                   wraps=req_file.build_parser) as mock_build_parser:
+            parse_line = build_line_parser(finder)
+            mock_build_parser.reset_mock()
+            parsed = [parse_line(line) for line in lines]
+        self.assertEqual([(args_str, vars(opts)) for args_str, opts in parsed],
+                         [(args_str, vars(opts)) for args_str, opts in expected])
+        self.assertEqual(mock_build_parser.call_count, 4)
+
+        self.assertEqual(parse_line(lines[2])[1].hashes, {'sha256': ['abc', 'def'], 'sha512': ['a:b']})
+        with self.assertRaises(OptionParsingError):
+            parse_line('foo==1.0 --hash=md5:abc')
+
+    def test_requirements_are_parsed_without_pip(self):
+        def parse(text, is_editable=False):
+            return parse_requirement(ParsedRequirement(text, is_editable, 'requirements.txt', False))
+
+        with patch('pur.requirements.install_req_from_parsed_requirement') as mock_install_req:
+            text = 'Flask[async, dotenv] >=2.0,<3 ; python_version >= "3.8"'
+            req = parse(text)
+            multiple = parse('foo (~=1.4.2, !=1.4.5)')
+        self.assertEqual(mock_install_req.call_count, 0)
+
+        self.assertIsInstance(req, PurRequirement)
+        self.assertFalse(hasattr(req, '__dict__'))
+        self.assertEqual(req.name, 'Flask')
+        self.assertEqual(req.canonical_name, 'flask')
+        self.assertEqual(req.extras, {'async', 'dotenv'})
+        self.assertEqual(str(req.markers), 'python_version >= "3.8"')
+        self.assertIsNone(req.link)
+        self.assertFalse(req.is_editable)
+        self.assertEqual(req.spec_ver[3], Version('2.0'))
+        self.assertEqual(req.spec_ver[4], Version('3'))
+        self.assertEqual(text[slice(*req.spec_span)], '>=2.0,<3')
+        self.assertEqual(multiple.spec_span, (5, 21))
+
+        for text, is_editable in [
+            ('foo @ https://files.example.com/foo-1.0.tar.gz', False),
+            ('git+https://github.com/example/foo.git#egg=foo', True),
+        ]:
+            req = parse(text, is_editable=is_editable)
+            self.assertEqual(req.name, 'foo')
+            self.assertIsNotNone(req.link)
+            self.assertEqual(req.is_editable, is_editable)
+            self.assertEqual(req.spec_ver, (None,) * 7)
+            self.assertIsNone(req.spec_span)
+        self.assertIsNone(parse('https://files.example.com/foo-1.0.tar.gz'))
+
+    def test_requirement_lines_are_rewritten_in_place(self):
+        def update(line, latest, text=None):
+            req = parse_requirement(ParsedRequirement(text or line, False, 'requirements.txt', False))
+            return update_requirement_line(req, line, req.spec_ver, Version(latest))
+
+        for line, latest, expected in [
+            ('foo==1.0', '1.2.0', 'foo==1.2.0'),
+            ('foo === 1.0  ', '2.0', 'foo === 2.0  '),
+            ('foo~=1.4.2', '1.6.3', 'foo~=1.6.3'),
+            ('foo ~= 1.4, != 1.5', '2.3.1', 'foo ~= 2.3, != 1.5'),
+            ('foo~=1.4', '2.0rc1', 'foo~=2.0rc1'),
+            ('foo>=1.0,<3,>=1.0', '2.1', 'foo>=2.1,<3,>=2.1'),
+            ('foo (>=1.0, !=1.0.1)', '1.2', 'foo (>=1.2, !=1.0.1)'),
+            ('foo-bar[baz]==1.0 ; python_version < "3.0"', '2.0',
+             'foo-bar[baz]==2.0 ; python_version < "3.0"'),
+            ('foo==1.0,>=0.9', '2.0', 'foo==2.0,>=0.9'),
+            ('foo>1.0', '2.0', 'foo>1.0'),
+        ]:
+            self.assertEqual(update(line, latest), expected)
+
+        # spans recorded for the joined line don't match the original lines
+        self.assertEqual(update('foo\\\n==1.0 \\\n    --hash=sha256:abc', '2.0', text='foo==1.0     '),
+                         'foo\\\n==2.0 \\\n    --hash=sha256:abc')
+
+    def test_retry_after_is_capped_by_default(self):
+        session = PurSession(retries=5)
+        retry = session.get_adapter('https://pypi.example.com/simple/').max_retries
+        self.assertEqual(retry.max_backoff, 120)
+
+        response = Mock()
+        response.headers = {'Retry-After': '3600'}
+        self.assertEqual(retry.get_retry_after(response), 120)
+        session.close()
+
+    def test_invalid_retries_and_timeout(self):
+        for args, message in [
+            (['--retries', '-1'], '--retries must be a non-negative integer.'),
+            (['--timeout', '0'], '--timeout must be a positive number.'),
+            (['--max-backoff', '-1'], '--max-backoff must be a non-negative number.'),
+            (['--max-host-failures', '-1'], '--max-host-failures must be a non-negative integer.'),
+        ]:
+            result = self.runner.invoke(pur, ['-r', 'tests/samples/requirements.txt'] + args)
+            self.assertEqual(result.exit_code, 2)
+            self.assertIn(message, result.output)
@@ -2,8 +2,10 @@
 
 import os
 import logging
+import threading
 import unittest
 from contextlib import contextmanager
+from http.server import ThreadingHTTPServer
 from unittest.mock import patch
 
 
@@ -45,6 +47,21 @@ class TestCase(unittest.TestCase):
     def assertListsEqual(self, first_list, second_list):
         self.assertEqual(self.normalize_list(first_list), self.normalize_list(second_list))
 
+    @contextmanager
+    def serve(self, handler_class):
+        """Runs a local http server in a thread, yielding its base url."""
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            yield 'http://127.0.0.1:{0}'.format(server.server_port)
+        finally:
+            server.shutdown()
+            server.server_close()
+
     @contextmanager
     def cd(self, newdir):
         prevdir = os.getcwd()